@@ -11,17 +11,117 @@ Clients:
 
 import asyncio
 import aiohttp
-import requests
-import json
+import orjson
 import os
+import re
+import time
+from array import array
 from dotenv import load_dotenv
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Optional, Callable, List
-from collections import deque
 
 # Load environment variables
 load_dotenv()
 
+# REST endpoints (built once, not per call)
+GAMMA_API_URL = "https://gamma-api.polymarket.com"
+CLOB_API_URL = "https://clob.polymarket.com"
+BTC_15M_SERIES_ID = "10192"
+_SERIES_15M_URL = f"{GAMMA_API_URL}/series/{BTC_15M_SERIES_ID}"
+
+# Outcome labels that mean the first token is DOWN (token order must be swapped)
+NEGATIVE_OUTCOMES = frozenset({"no", "below", "down"})
+
+# Strike price patterns for market descriptions, tried in order
+_TARGET_PRICE_PATTERNS = [
+    re.compile(r'\$([0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]+)?)', re.IGNORECASE),  # $96,500.00
+    re.compile(r'\$([0-9]+(?:\.[0-9]+)?)', re.IGNORECASE),  # $96500
+    re.compile(r'above ([0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]+)?)', re.IGNORECASE),  # above 96,500
+]
+
+# CLOB prices are kept internally as integer ticks of 1/PRICE_SCALE
+PRICE_SCALE = 10000
+
+
+def _to_ticks(price) -> int:
+    """Convert a price (str or float) to integer ticks, parsing it only once"""
+    return int(round(float(price) * PRICE_SCALE))
+
+
+# Shared REST session (Gamma / CLOB). Created lazily on the running loop so all
+# discovery calls reuse pooled keep-alive connections instead of paying a new
+# TCP + TLS handshake per request. aiohttp sends "Accept-Encoding: gzip, deflate"
+# and adds "br" (and decodes it) when the Brotli package is installed.
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=20, keepalive_timeout=60, ttl_dns_cache=300)
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Accept": "application/json"},
+        )
+    return _http_session
+
+
+# url -> (ETag, Last-Modified, parsed body) for conditional GETs
+_etag_cache: Dict[str, tuple] = {}
+
+
+async def _get_json(url: str, timeout: float = 10, use_etag: bool = False):
+    """
+    GET *url* on the shared session. Returns parsed JSON, or None on non-200.
+    With *use_etag*, revalidates with If-None-Match / If-Modified-Since and
+    returns the cached body on 304 without re-downloading or re-parsing.
+    """
+    session = _get_http_session()
+    headers = None
+    cached = _etag_cache.get(url) if use_etag else None
+    if cached:
+        etag, last_modified, _ = cached
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+        if resp.status == 304 and cached:
+            return cached[2]
+        if resp.status != 200:
+            return None
+        data = orjson.loads(await resp.read())
+        if use_etag:
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+            if etag or last_modified:
+                _etag_cache[url] = (etag, last_modified, data)
+        return data
+
+
+async def warm_up_http_session(timeout: float = 5):
+    """Open pooled connections to the REST hosts before the first real request."""
+    session = _get_http_session()
+
+    async def _head(url: str):
+        try:
+            async with session.head(url, timeout=aiohttp.ClientTimeout(total=timeout)):
+                pass
+        except Exception:
+            pass  # Best effort - the first real request will just pay the handshake
+
+    await asyncio.gather(_head(GAMMA_API_URL), _head(CLOB_API_URL))
+
+
+async def close_http_session():
+    """Close the shared REST session (call once on shutdown)."""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
 
 class BinanceClient:
     """Binance WebSocket for real-time BTC price"""
@@ -48,38 +148,37 @@ class BinanceClient:
             try:
                 # Always use direct connection for Binance as requested
                 async with aiohttp.ClientSession() as session:
-                    async with session.ws_connect(self.ws_url, heartbeat=15) as ws:
-                        self.last_message_time = datetime.now().timestamp()
+                    async with session.ws_connect(self.ws_url, heartbeat=15, receive_timeout=60) as ws:
+                        self.last_message_time = time.time()
                         self.connection_healthy = True
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] Binance connected (direct)")
+                        print(f"[{time.strftime('%H:%M:%S')}] Binance connected (direct)")
                         
                         while self.running:
                             try:
-                                # Increase timeout for better stability
-                                msg = await asyncio.wait_for(ws.receive(), timeout=60)
+                                # Increase timeout for better stability (receive_timeout=60)
+                                raw = await ws.receive_str()
                             except asyncio.TimeoutError:
-                                print(f"[{datetime.now().strftime('%H:%M:%S')}] [Binance] Timeout (60s), reconnecting...")
+                                print(f"[{time.strftime('%H:%M:%S')}] [Binance] Timeout (60s), reconnecting...")
+                                break
+                            except TypeError:
+                                # Non-text frame: CLOSE / ERROR
+                                print(f"[Binance] WebSocket closed or error")
                                 break
 
                             if not self.running:
                                 break
                             
-                            if msg.type == aiohttp.WSMsgType.TEXT:
-                                self.last_message_time = datetime.now().timestamp()
-                                self.connection_healthy = True
-                                try:
-                                    data = json.loads(msg.data)
-                                    price = float(data.get('p', 0))
-                                    
-                                    if price > 0:
-                                        self.last_price = price
-                                        self.on_price_update(price)
-                                except:
-                                    continue
-                            
-                            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
-                                print(f"[Binance] WebSocket closed or error")
-                                break
+                            self.last_message_time = time.time()
+                            self.connection_healthy = True
+                            try:
+                                data = orjson.loads(raw)
+                                price = float(data.get('p', 0))
+                                
+                                if price > 0:
+                                    self.last_price = price
+                                    self.on_price_update(price)
+                            except:
+                                continue
                         
             except Exception as e:
                 if self.running:
@@ -91,6 +190,16 @@ class BinanceClient:
         self.running = False
 
 
+def _normalize_dict_levels(levels) -> List[Dict]:
+    """Orderbook levels sent as {"price": "...", "size": "..."}"""
+    return [{"price": float(lvl.get('price', 0)), "size": float(lvl.get('size', 0))} for lvl in levels]
+
+
+def _normalize_pair_levels(levels) -> List[Dict]:
+    """Orderbook levels sent as ["price", "size"]"""
+    return [{"price": float(lvl[0]), "size": float(lvl[1])} for lvl in levels if len(lvl) >= 2]
+
+
 class CLOBClient:
     """Polymarket CLOB WebSocket for orderbook"""
     
@@ -104,11 +213,28 @@ class CLOBClient:
         self.running = False
         
         # Multi-market support
-        # markets: slug -> {'tokens': [up_id, down_id], 'prices': {...}}
+        # markets: slug -> {'tokens': [up_id, down_id], 'bid': [up, down], 'ask': [up, down], ...}
         self.markets = {}
-        self.token_to_slug = {} # asset_id -> slug
+        self.token_index = {} # asset_id -> (slug, side, market state, handler); side 0 = UP, 1 = DOWN
         
         self.need_resubscribe = False
+        self._subscribe_frame = None  # Encoded subscription for all assets in token_index
+        
+        # event_type -> handler(data, slug, side, m_data) -> price_updated
+        self._handlers = {
+            'book': self._on_book,
+            'best_bid_ask': self._on_best_bid_ask,
+            'price_change': self._on_price_change,
+            'last_trade_price': self._on_last_trade,
+            'tick_size_change': self._on_ignored,
+        }
+        
+        # Orderbook level normalizer, chosen from the first snapshot of each connection
+        self._normalize_levels = None
+        
+        # Raw frames waiting to be parsed (receive loop -> parser task)
+        self._rx_queue = asyncio.Queue(maxsize=1024)
+        self.rx_dropped = 0
         
         # Connection health monitoring
         self.last_message_time = None
@@ -122,18 +248,20 @@ class CLOBClient:
             return
 
         print(f"[CLOB] Adding market {market_slug}")
-        self.markets[market_slug] = {
+        m_data = {
             'tokens': token_ids,
-            'up_bid': None, 'up_ask': None,
-            'down_bid': None, 'down_ask': None,
-            'up_bids': [], 'up_asks': [],
-            'down_bids': [], 'down_asks': []
+            # Per side [UP, DOWN]
+            'bid': [None, None], 'ask': [None, None],
+            'bids': [[], []], 'asks': [[], []],
+            'last_emit': None  # (up_bid, up_ask, down_bid, down_ask) ticks last sent
         }
+        self.markets[market_slug] = m_data
         
-        # Update map
-        for tid in token_ids:
-            self.token_to_slug[tid] = market_slug
+        # Update map (only the first two tokens are UP / DOWN)
+        for side, tid in enumerate(token_ids[:2]):
+            self.token_index[tid] = (market_slug, side, m_data, self._make_token_handler(market_slug, side, m_data))
             
+        self._build_subscribe_frame()
         self.need_resubscribe = True
 
     def remove_market(self, market_slug: str):
@@ -142,20 +270,51 @@ class CLOBClient:
             print(f"[CLOB] Removing market {market_slug}")
             tokens = self.markets[market_slug]['tokens']
             for tid in tokens:
-                if tid in self.token_to_slug:
-                    del self.token_to_slug[tid]
+                entry = self.token_index.get(tid)
+                if entry is not None and entry[0] == market_slug:
+                    del self.token_index[tid]
             del self.markets[market_slug]
+            self._build_subscribe_frame()
             self.need_resubscribe = True
 
+    def _build_subscribe_frame(self):
+        """Encode the subscription message once per asset list change"""
+        if not self.token_index:
+            self._subscribe_frame = None
+            return
+        self._subscribe_frame = orjson.dumps({
+            "type": "market",
+            "assets_ids": list(self.token_index),
+            "custom_feature_enabled": True
+        }).decode()
+
     async def start(self):
         """Start WebSocket connection"""
         self.running = True
-        
+        parser_task = asyncio.create_task(self._parser_loop())
+        try:
+            await self._receive_loop()
+        finally:
+            parser_task.cancel()
+
+    async def _parser_loop(self):
+        """Parse queued frames and dispatch updates, off the receive loop"""
+        while True:
+            raw = await self._rx_queue.get()
+            try:
+                data = orjson.loads(raw)
+                if isinstance(data, list):
+                    for item in data: self._parse_market_data(item)
+                elif isinstance(data, dict):
+                    self._parse_market_data(data)
+            except: continue
+
+    async def _receive_loop(self):
         while self.running:
             try:
-                # Build asset list
-                all_assets = list(self.token_to_slug.keys())
-                if not all_assets:
+                # Subscription for the current asset list (rebuilt when markets change)
+                subscribe_frame = self._subscribe_frame
+                if subscribe_frame is None:
                     await asyncio.sleep(1)
                     continue
 
@@ -163,45 +322,40 @@ class CLOBClient:
                     # Use aiohttp built-in heartbeat for protocol-level PING/PONG
                     # Polymarket CLOB requires stable connection, 20s heartbeat is optimal
                     async with session.ws_connect(self.ws_url, heartbeat=20, receive_timeout=60) as ws:
-                        self.last_message_time = datetime.now().timestamp()
+                        self.last_message_time = time.time()
                         self.connection_healthy = True
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] CLOB connected ({len(self.markets)} markets) (direct)")
+                        self._normalize_levels = None
+                        print(f"[{time.strftime('%H:%M:%S')}] CLOB connected ({len(self.markets)} markets) (direct)")
                         
-                        subscribe_msg = {
-                            "type": "market",
-                            "assets_ids": all_assets,
-                            "custom_feature_enabled": True
-                        }
-                        await ws.send_json(subscribe_msg)
+                        await ws.send_str(subscribe_frame)
                         self.need_resubscribe = False
                         
                         try:
                             while self.running:
                                 if self.need_resubscribe:
-                                    print(f"[{datetime.now().strftime('%H:%M:%S')}] [CLOB] Markets changed, reconnecting...")
+                                    print(f"[{time.strftime('%H:%M:%S')}] [CLOB] Markets changed, reconnecting...")
                                     break
                                 
                                 try:
-                                    msg = await ws.receive()
+                                    raw = await ws.receive_str()
                                 except asyncio.TimeoutError:
                                     # This should be handled by receive_timeout or heartbeat
                                     continue 
+                                except TypeError:
+                                    # Non-text frame: CLOSE / ERROR
+                                    print(f"[CLOB] WebSocket closed or error")
+                                    break
 
                                 if not self.running: break
                                 
-                                if msg.type == aiohttp.WSMsgType.TEXT:
-                                    self.last_message_time = datetime.now().timestamp()
-                                    try:
-                                        data = json.loads(msg.data)
-                                        if isinstance(data, list):
-                                            for item in data: self._parse_market_data(item)
-                                        elif isinstance(data, dict):
-                                            self._parse_market_data(data)
-                                    except: continue
-                                        
-                                elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
-                                    print(f"[CLOB] WebSocket {msg.type.name}")
-                                    break
+                                self.last_message_time = time.time()
+                                try:
+                                    self._rx_queue.put_nowait(raw)
+                                except asyncio.QueueFull:
+                                    # Parser is behind: drop rather than buffer without bound
+                                    self.rx_dropped += 1
+                                    if self.rx_dropped % 1000 == 1:
+                                        print(f"[{time.strftime('%H:%M:%S')}] [CLOB] Parser backlog, dropped {self.rx_dropped} frames")
                         except Exception as e:
                             print(f"[CLOB] Connection error in loop: {e}")
                             break
@@ -219,18 +373,9 @@ class CLOBClient:
         # OR it gives winning_asset_id.
         if data.get('event_type') == 'market_resolved':
             winning_asset_id = data.get('winning_asset_id')
-            # Try to find slug from token_to_slug if asset_id provided, usually not in this event?
-            # Data usually has asset_ids associated? 
-            # If not, we iterate markets to find one that has this token.
-            slug = None
-            if winning_asset_id in self.token_to_slug:
-                slug = self.token_to_slug[winning_asset_id]
-            else:
-                # Fallback: scan all markets
-                for m_slug, m_data in self.markets.items():
-                    if winning_asset_id in m_data['tokens']:
-                        slug = m_slug
-                        break
+            # token_index covers both outcome tokens of every tracked market
+            entry = self.token_index.get(winning_asset_id)
+            slug = entry[0] if entry is not None else None
             
             if slug and self.on_market_resolved:
                 print(f"[CLOB] Market resolved: {slug}")
@@ -238,194 +383,185 @@ class CLOBClient:
                 self.remove_market(slug)
             return
 
-        asset_id = data.get('asset_id')
-        if not asset_id or asset_id not in self.token_to_slug:
-            return
-            
-        slug = self.token_to_slug[asset_id]
-        m_data = self.markets[slug]
-        
-        # Debug: Track event types (throttled to avoid spam) - DISABLED
-        # if not hasattr(self, '_last_debug_time'):
-        #     self._last_debug_time = {}
-        # 
-        # now_ts = datetime.now().timestamp()
-        # if slug not in self._last_debug_time or (now_ts - self._last_debug_time.get(slug, 0)) > 10:
-        #     event_type = "unknown"
-        #     if 'best_bid' in data or 'best_ask' in data:
-        #         event_type = "best_bid_ask"
-        #     elif 'price' in data:
-        #         event_type = "price_change"
-        #     elif 'last_trade_price' in data:
-        #         event_type = "last_trade"
-        #     elif 'bids' in data and 'asks' in data:
-        #         event_type = "orderbook"
-        #     
-        #     print(f"[CLOB DEBUG] {slug[:20]}: Event '{event_type}' (asset {asset_id[:8]}...)")
-        #     self._last_debug_time[slug] = now_ts
-        
-        # Parse Price
+        # One lookup gives the token's prebuilt handler
+        entry = self.token_index.get(data.get('asset_id'))
+        if entry is not None:
+            entry[3](data)
+
+    def _make_token_handler(self, slug: str, side: int, m_data: Dict) -> Callable[[Dict], None]:
+        """Build a handler with this token's market, side and state bound in"""
+        handlers = self._handlers
+        on_untyped = self._on_untyped
+        send_update = self._send_update
+        
+        def handle(data: Dict):
+            # Dispatch on event_type when present
+            handler = handlers.get(data.get('event_type'))
+            if handler is not None:
+                price_updated = handler(data, slug, side, m_data)
+            else:
+                price_updated = on_untyped(data, slug, side, m_data)
+            if price_updated:
+                send_update(slug)
+        
+        return handle
+
+    def _on_untyped(self, data: Dict, slug: str, side: int, m_data: Dict) -> bool:
+        # No event_type: infer the event from its fields
         price_updated = False
         
         # PRIORITY 1: best_bid_ask event (real-time, requires custom_feature_enabled)
         if 'best_bid' in data or 'best_ask' in data:
-            best_bid = data.get('best_bid')
-            best_ask = data.get('best_ask')
-            
-            if best_bid or best_ask:
-                if asset_id == m_data['tokens'][0]: # UP
-                    if best_bid: m_data['up_bid'] = float(best_bid)
-                    if best_ask: m_data['up_ask'] = float(best_ask)
-                elif len(m_data['tokens']) > 1 and asset_id == m_data['tokens'][1]: # DOWN
-                    if best_bid: m_data['down_bid'] = float(best_bid)
-                    if best_ask: m_data['down_ask'] = float(best_ask)
-                price_updated = True
-        
+            price_updated = self._on_best_bid_ask(data, slug, side, m_data)
         # PRIORITY 2: price_change event (sent on order updates)
         elif 'price' in data:
-            price = float(data.get('price', 0))
-            if price > 0:
-                if asset_id == m_data['tokens'][0]: # UP
-                    # Update mid price, keep spread from last known bid/ask
-                    m_data['up_bid'] = price
-                    m_data['up_ask'] = price
-                elif len(m_data['tokens']) > 1 and asset_id == m_data['tokens'][1]: # DOWN
-                    m_data['down_bid'] = price
-                    m_data['down_ask'] = price
-                price_updated = True
-        
+            price_updated = self._on_price(data, slug, side, m_data)
         # PRIORITY 3: Last Trade
         elif 'last_trade_price' in data:
-            price = float(data.get('last_trade_price', 0))
-            if price > 0:
-                if asset_id == m_data['tokens'][0]: # UP
-                    m_data['up_bid'] = price
-                    m_data['up_ask'] = price
-                elif len(m_data['tokens']) > 1 and asset_id == m_data['tokens'][1]: # DOWN
-                    m_data['down_bid'] = price
-                    m_data['down_ask'] = price
-                price_updated = True
-
+            price_updated = self._on_last_trade(data, slug, side, m_data)
+        
         # PRIORITY 4: Full Orderbook (snapshot or update)
         if 'bids' in data and 'asks' in data:
-            bids = data.get('bids', [])
-            asks = data.get('asks', [])
-            
-            # Normalize bids/asks to list of {"price": float, "size": float}
-            def normalize_levels(levels):
-                result = []
-                for lvl in levels:
-                    if isinstance(lvl, dict):
-                        result.append({"price": float(lvl.get('price', 0)), "size": float(lvl.get('size', 0))})
-                    elif isinstance(lvl, (list, tuple)) and len(lvl) >= 2:
-                        result.append({"price": float(lvl[0]), "size": float(lvl[1])})
-                return result
-            
+            price_updated = self._on_book(data, slug, side, m_data, use_top=not price_updated) or price_updated
+        return price_updated
+
+    def _on_best_bid_ask(self, data: Dict, slug: str, side: int, m_data: Dict) -> bool:
+        best_bid = data.get('best_bid')
+        best_ask = data.get('best_ask')
+        
+        if best_bid or best_ask:
+            if best_bid: m_data['bid'][side] = _to_ticks(best_bid)
+            if best_ask: m_data['ask'][side] = _to_ticks(best_ask)
+            return True
+        return False
+
+    def _on_price(self, data: Dict, slug: str, side: int, m_data: Dict) -> bool:
+        ticks = _to_ticks(data.get('price') or 0)
+        if ticks > 0:
+            # Update mid price, keep spread from last known bid/ask
+            m_data['bid'][side] = m_data['ask'][side] = ticks
+            return True
+        return False
+
+    def _on_price_change(self, data: Dict, slug: str, side: int, m_data: Dict) -> bool:
+        # Newer price_change events carry the resulting top of book
+        if 'best_bid' in data or 'best_ask' in data:
+            return self._on_best_bid_ask(data, slug, side, m_data)
+        return self._on_price(data, slug, side, m_data)
+
+    def _on_last_trade(self, data: Dict, slug: str, side: int, m_data: Dict) -> bool:
+        ticks = _to_ticks(data.get('last_trade_price') or data.get('price') or 0)
+        if ticks > 0:
+            m_data['bid'][side] = m_data['ask'][side] = ticks
+            return True
+        return False
+
+    def _on_book(self, data: Dict, slug: str, side: int, m_data: Dict, use_top: bool = True) -> bool:
+        bids = data.get('bids', [])
+        asks = data.get('asks', [])
+        
+        # Normalize bids/asks to list of {"price": float, "size": float}
+        # Level format (dict vs [price, size]) is detected once per connection
+        normalize_levels = self._normalize_levels
+        if normalize_levels is None:
+            sample = bids[0] if bids else (asks[0] if asks else None)
+            if sample is not None:
+                normalize_levels = _normalize_dict_levels if isinstance(sample, dict) else _normalize_pair_levels
+                self._normalize_levels = normalize_levels
+        
+        if normalize_levels is None:
+            norm_bids, norm_asks = [], []
+        else:
             norm_bids = normalize_levels(bids)
             norm_asks = normalize_levels(asks)
+        
+        # Store full order book by side
+        m_data['bids'][side] = norm_bids
+        m_data['asks'][side] = norm_asks
+        
+        # Send orderbook update
+        if self.on_orderbook_update:
+            self.on_orderbook_update(slug, {
+                "up_bids": m_data['bids'][0],
+                "up_asks": m_data['asks'][0],
+                "down_bids": m_data['bids'][1],
+                "down_asks": m_data['asks'][1]
+            })
+        
+        if use_top:
+            best_bid = norm_bids[-1]['price'] if norm_bids else None
+            best_ask = norm_asks[-1]['price'] if norm_asks else None
             
-            # Store full order book by side
-            if asset_id == m_data['tokens'][0]:  # UP
-                m_data['up_bids'] = norm_bids
-                m_data['up_asks'] = norm_asks
-            elif len(m_data['tokens']) > 1 and asset_id == m_data['tokens'][1]:  # DOWN
-                m_data['down_bids'] = norm_bids
-                m_data['down_asks'] = norm_asks
-            
-            # Send orderbook update
-            if self.on_orderbook_update:
-                self.on_orderbook_update(slug, {
-                    "up_bids": m_data['up_bids'],
-                    "up_asks": m_data['up_asks'],
-                    "down_bids": m_data['down_bids'],
-                    "down_asks": m_data['down_asks']
-                })
-            
-            if not price_updated:
-                best_bid = norm_bids[-1]['price'] if norm_bids else None
-                best_ask = norm_asks[-1]['price'] if norm_asks else None
-                
-                if best_bid or best_ask:
-                    if asset_id == m_data['tokens'][0]:
-                        if best_bid: m_data['up_bid'] = best_bid
-                        if best_ask: m_data['up_ask'] = best_ask
-                    elif len(m_data['tokens']) > 1 and asset_id == m_data['tokens'][1]:
-                        if best_bid: m_data['down_bid'] = best_bid
-                        if best_ask: m_data['down_ask'] = best_ask
-                    price_updated = True
-
-        if price_updated:
-            self._send_update(slug)
+            if best_bid or best_ask:
+                # Normalized levels are floats already
+                if best_bid: m_data['bid'][side] = int(round(best_bid * PRICE_SCALE))
+                if best_ask: m_data['ask'][side] = int(round(best_ask * PRICE_SCALE))
+                return True
+        return False
+
+    @staticmethod
+    def _on_ignored(data: Dict, slug: str, side: int, m_data: Dict) -> bool:
+        return False
 
     def _send_update(self, slug):
         m = self.markets[slug]
+        bid, ask = m['bid'], m['ask']
         
-        # Check if we have UP prices
-        up_prices = None
-        if m['up_bid'] is not None and m['up_ask'] is not None:
-            up_prices = {
-                "bid": round(m['up_bid'], 4),
-                "ask": round(m['up_ask'], 4),
-                "mid": round((m['up_bid'] + m['up_ask']) / 2, 4)
-            }
-            
-        # Check if we have DOWN prices
-        down_prices = None
-        if m['down_bid'] is not None and m['down_ask'] is not None:
-            down_prices = {
-                "bid": round(m['down_bid'], 4),
-                "ask": round(m['down_ask'], 4),
-                "mid": round((m['down_bid'] + m['down_ask']) / 2, 4)
-            }
-        
-        # FALLBACK: If DOWN is missing but UP exists, calculate DOWN = 1 - UP
-        # This is valid for binary markets where UP + DOWN = 1.0
-        if up_prices and not down_prices:
-            down_prices = {
-                "bid": round(1.0 - m['up_ask'], 4),  # bid/ask are inverted
-                "ask": round(1.0 - m['up_bid'], 4),
-                "mid": round(1.0 - up_prices['mid'], 4)
-            }
+        # FALLBACK: If one side is missing, derive it as 1 - other side
+        # This is valid for binary markets where UP + DOWN = 1.0 (bid/ask are inverted)
+        has_up = bid[0] is not None and ask[0] is not None
+        has_down = bid[1] is not None and ask[1] is not None
+        if has_up and not has_down:
             # Update internal state for consistency
-            m['down_bid'] = down_prices['bid']
-            m['down_ask'] = down_prices['ask']
-        
-        # FALLBACK: If UP is missing but DOWN exists, calculate UP = 1 - DOWN
-        elif down_prices and not up_prices:
-            up_prices = {
-                "bid": round(1.0 - m['down_ask'], 4),
-                "ask": round(1.0 - m['down_bid'], 4),
-                "mid": round(1.0 - down_prices['mid'], 4)
-            }
-            # Update internal state
-            m['up_bid'] = up_prices['bid']
-            m['up_ask'] = up_prices['ask']
-            
-        if up_prices or down_prices:
-            self.on_price_update(slug, up_prices, down_prices)
+            bid[1] = PRICE_SCALE - ask[0]
+            ask[1] = PRICE_SCALE - bid[0]
+        elif has_down and not has_up:
+            bid[0] = PRICE_SCALE - ask[1]
+            ask[0] = PRICE_SCALE - bid[1]
+        elif not has_up:
+            return
+        
+        # Skip the callback when nothing changed since the last emit
+        ticks = (bid[0], ask[0], bid[1], ask[1])
+        if ticks == m['last_emit']:
+            return
+        m['last_emit'] = ticks
+        
+        # Integer ticks -> price only on emit
+        up_prices = {
+            "bid": bid[0] / PRICE_SCALE,
+            "ask": ask[0] / PRICE_SCALE,
+            "mid": ((bid[0] + ask[0]) // 2) / PRICE_SCALE
+        }
+        down_prices = {
+            "bid": bid[1] / PRICE_SCALE,
+            "ask": ask[1] / PRICE_SCALE,
+            "mid": ((bid[1] + ask[1]) // 2) / PRICE_SCALE
+        }
+        
+        self.on_price_update(slug, up_prices, down_prices)
     
     def stop(self):
         """Stop WebSocket"""
         self.running = False
 
-    def get_market(self, market_slug: str) -> Optional[Dict]:
+    async def get_market(self, market_slug: str) -> Optional[Dict]:
         """Fetch single market data via REST (CLOB first, then Gamma fallback)"""
         # 1. Try CLOB
-        url = f"https://clob.polymarket.com/markets/{market_slug}"
+        url = f"{CLOB_API_URL}/markets/{market_slug}"
         try:
-            resp = requests.get(url, timeout=5)
-            if resp.status_code == 200:
-                return resp.json()
+            data = await _get_json(url, timeout=5)
+            if data is not None:
+                return data
         except Exception as e:
             print(f"[CLOB] get_market {market_slug} CLOB error: {e}")
-            
+
         # 2. Try Gamma (Fallback for old/resolved markets)
         try:
             # Gamma usually returns list for ?slug=...
-            g_url = f"https://gamma-api.polymarket.com/markets?slug={market_slug}"
-            g_resp = requests.get(g_url, timeout=5)
-            if g_resp.status_code == 200:
-                data = g_resp.json()
+            g_url = f"{GAMMA_API_URL}/markets?slug={market_slug}"
+            data = await _get_json(g_url, timeout=5)
+            if data is not None:
                 if isinstance(data, list) and data:
                     # Found in Gamma
                     return data[0]
@@ -440,6 +576,30 @@ class CLOBClient:
 class RTDSClient:
     """Polymarket RTDS WebSocket for oracle prices"""
     
+    # Subscription messages, encoded once
+    SUBSCRIBE_FRAMES = tuple(orjson.dumps(msg).decode() for msg in (
+        {
+            "action": "subscribe",
+            "subscriptions": [
+                {
+                    "topic": "crypto_prices",
+                    "type": "update",
+                    "filters": "btcusdt"
+                }
+            ]
+        },
+        {
+            "action": "subscribe",
+            "subscriptions": [
+                {
+                    "topic": "crypto_prices_chainlink",
+                    "type": "*",
+                    "filters": '{"symbol":"btc/usd"}'
+                }
+            ]
+        },
+    ))
+    
     def __init__(self, on_oracle_update: Callable[[float], None]):
         """
         Args:
@@ -450,8 +610,13 @@ class RTDSClient:
         self.running = False
         self.last_oracle_price = None
         
-        # Price history for calculating momentum
-        self.price_history = deque(maxlen=100000)  # Increased to guarantee 20+ minutes of history during high volatility
+        # Price history for calculating momentum.
+        # Ring buffer stored as two flat float arrays (unix ts, price) instead of
+        # a deque of dicts; size guarantees 20+ minutes of history during high volatility
+        self.history_size = 100000
+        self.history_times = array('d', bytes(8 * self.history_size))
+        self.history_prices = array('d', bytes(8 * self.history_size))
+        self.history_idx = 0  # Total number of samples written
         
         # Connection health monitoring
         self.last_message_time = None
@@ -464,78 +629,57 @@ class RTDSClient:
         while self.running:
             try:
                 async with aiohttp.ClientSession() as session:
-                    async with session.ws_connect(self.ws_url, heartbeat=20) as ws:
-                        self.last_message_time = datetime.now().timestamp()
+                    async with session.ws_connect(self.ws_url, heartbeat=20, receive_timeout=30) as ws:
+                        self.last_message_time = time.time()
                         self.connection_healthy = True
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] RTDS connected (direct)")
+                        print(f"[{time.strftime('%H:%M:%S')}] RTDS connected (direct)")
                         
-                        # Subscribe to BTC price (Binance source)
-                        subscribe_msg = {
-                            "action": "subscribe",
-                            "subscriptions": [
-                                {
-                                    "topic": "crypto_prices",
-                                    "type": "update",
-                                    "filters": "btcusdt"
-                                }
-                            ]
-                        }
-                        await ws.send_json(subscribe_msg)
-                        
-                        # Also subscribe to Chainlink
-                        subscribe_chainlink = {
-                            "action": "subscribe",
-                            "subscriptions": [
-                                {
-                                    "topic": "crypto_prices_chainlink",
-                                    "type": "*",
-                                    "filters": '{"symbol":"btc/usd"}'
-                                }
-                            ]
-                        }
-                        await ws.send_json(subscribe_chainlink)
+                        # Subscribe to BTC price (Binance source), then Chainlink
+                        for frame in self.SUBSCRIBE_FRAMES:
+                            await ws.send_str(frame)
                         
                         while self.running:
                             try:
-                                msg = await asyncio.wait_for(ws.receive(), timeout=30)
+                                raw = await ws.receive_str()
                             except asyncio.TimeoutError:
-                                print(f"[{datetime.now().strftime('%H:%M:%S')}] [RTDS] Timeout (30s), reconnecting...")
+                                print(f"[{time.strftime('%H:%M:%S')}] [RTDS] Timeout (30s), reconnecting...")
+                                break
+                            except TypeError:
+                                # Non-text frame: CLOSE / ERROR
+                                print(f"[RTDS] WebSocket closed or error")
                                 break
 
                             if not self.running:
                                 break
                             
-                            if msg.type == aiohttp.WSMsgType.TEXT:
-                                self.last_message_time = datetime.now().timestamp()
-                                self.connection_healthy = True
-                                try:
-                                    data = json.loads(msg.data)
-                                    
-                                    topic = data.get('topic', '')
-                                    payload = data.get('payload', {})
+                            self.last_message_time = time.time()
+                            self.connection_healthy = True
+                            try:
+                                data = orjson.loads(raw)
+                                
+                                topic = data.get('topic', '')
+                                payload = data.get('payload', {})
+                                
+                                if 'crypto_prices' in topic:
+                                    # Extract oracle price
+                                    price = payload.get('value') or payload.get('price')
                                     
-                                    if 'crypto_prices' in topic:
-                                        # Extract oracle price
-                                        price = payload.get('value') or payload.get('price')
-                                        
-                                        if price:
+                                    if price:
+                                        # RTDS sends JSON numbers; only strings need converting
+                                        if type(price) is not float:
                                             price = float(price)
-                                            self.last_oracle_price = price
-                                            
-                                            # Add to history
-                                            self.price_history.append({
-                                                'time': datetime.now(timezone.utc),
-                                                'price': price
-                                            })
-                                            
-                                            self.on_oracle_update(price)
-                                
-                                except Exception as e:
-                                    pass
+                                        self.last_oracle_price = price
+                                        
+                                        # Add to history
+                                        pos = self.history_idx % self.history_size
+                                        self.history_times[pos] = time.time()
+                                        self.history_prices[pos] = price
+                                        self.history_idx += 1
+                                        
+                                        self.on_oracle_update(price)
                             
-                            elif msg.type == aiohttp.WSMsgType.ERROR:
-                                print(f"[RTDS] WebSocket error")
-                                break
+                            except Exception as e:
+                                pass
                         
             except Exception as e:
                 if self.running:
@@ -549,20 +693,30 @@ class RTDSClient:
         Returns:
             Price change in USD (positive = up, negative = down)
         """
-        if len(self.price_history) < 2:
+        size = self.history_size
+        total = self.history_idx
+        count = min(total, size)
+        if count < 2:
             return None
         
-        now = datetime.now(timezone.utc)
-        cutoff = now - timedelta(seconds=seconds)
+        times = self.history_times
+        first = total - count  # Logical index of the oldest stored sample
+        cutoff = time.time() - seconds
         
-        # Get prices within timeframe
-        recent_prices = [p for p in self.price_history if p['time'] >= cutoff]
+        # Binary search for the first sample within timeframe (times are ascending)
+        lo, hi = first, total
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if times[mid % size] < cutoff:
+                lo = mid + 1
+            else:
+                hi = mid
         
-        if len(recent_prices) < 2:
+        if total - lo < 2:
             return None
         
-        start_price = recent_prices[0]['price']
-        end_price = recent_prices[-1]['price']
+        start_price = self.history_prices[lo % size]
+        end_price = self.history_prices[(total - 1) % size]
         
         return end_price - start_price
     
@@ -575,26 +729,25 @@ class MarketDiscovery:
     """Discover active BTC 15m markets"""
     
     @staticmethod
-    def get_current_market() -> Optional[Dict]:
+    async def get_current_market() -> Optional[Dict]:
         """
         Get current active BTC 15m market.
         Returns market data with token_ids and end_date.
         """
-        series_id = "10192"  # BTC 15m series
-        
         try:
-            response = requests.get(
-                f"https://gamma-api.polymarket.com/series/{series_id}",
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                serie_data = response.json()
+            serie_data = await _get_json(_SERIES_15M_URL, use_etag=True)
+
+            if serie_data is not None:
                 now = datetime.now(timezone.utc)
                 
                 # Find the NEXT upcoming market (ending after now)
-                # Sort by end_time to get the closest one first
-                upcoming_markets = []
+                # Keep a running minimum of end_time: the closest one is the current market
+                selected_end_time, selected_event = None, None
+                
+                # Skip only already-expired or about-to-expire markets (< 10 seconds)
+                # This allows testing in the last minute but avoids selecting dead markets
+                MIN_BUFFER_SECONDS = 10
+                buffer_time = now + timedelta(seconds=MIN_BUFFER_SECONDS)
                 
                 for event_summary in serie_data.get("events", []):
                     end_time_str = event_summary.get("endDate", "")
@@ -603,42 +756,18 @@ class MarketDiscovery:
                     
                     end_time = datetime.fromisoformat(end_time_str.replace("Z", "+00:00"))
                     
-                    # Skip only already-expired or about-to-expire markets (< 10 seconds)
-                    # This allows testing in the last minute but avoids selecting dead markets
-                    MIN_BUFFER_SECONDS = 10
-                    buffer_time = now + timedelta(seconds=MIN_BUFFER_SECONDS)
-                    
-                    if end_time > buffer_time:
-                        upcoming_markets.append((end_time, event_summary))
+                    if end_time > buffer_time and (selected_end_time is None or end_time < selected_end_time):
+                        selected_end_time, selected_event = end_time, event_summary
                 
-                if not upcoming_markets:
+                if selected_event is None:
                     # No active markets found
                     # print(f"[MarketDiscovery] No upcoming markets found! Current UTC: {now.strftime('%Y-%m-%d %H:%M:%S')}")
                     return None
                 
-                # Sort by end_time (earliest first = current active market)
-                upcoming_markets.sort(key=lambda x: x[0])
-                
-                # Debug: Show what we found - DISABLED
-                # print(f"[MarketDiscovery] Current UTC: {now.strftime('%Y-%m-%d %H:%M:%S')}")
-                # print(f"[MarketDiscovery] Found {len(upcoming_markets)} upcoming market(s)")
-                # for i, (end_time, ev) in enumerate(upcoming_markets[:3]):  # Show first 3
-                #     mins_remaining = int((end_time - now).total_seconds() / 60)
-                #     print(f"  [{i+1}] '{ev.get('title', 'N/A')[:30]}' ends at {end_time.strftime('%Y-%m-%d %H:%M:%S')} UTC ({mins_remaining}m remaining)")
-                
-                # Select the FIRST one (earliest ending = current active market)
-                selected_end_time, selected_event = upcoming_markets[0]
-                # mins_remaining = int((selected_end_time - now).total_seconds() / 60)
-                # print(f"[MarketDiscovery] Selecting market #1 (ends in {mins_remaining}m)")
-                
                 event_id = selected_event.get('id')
-                event_resp = requests.get(
-                    f"https://gamma-api.polymarket.com/events/{event_id}",
-                    timeout=10
-                )
-                
-                if event_resp.status_code == 200:
-                    event_data = event_resp.json()
+                event_data = await _get_json(f"{GAMMA_API_URL}/events/{event_id}")
+
+                if event_data is not None:
                     markets = event_data.get("markets", [])
                     
                     if markets:
@@ -646,7 +775,7 @@ class MarketDiscovery:
                         clob_tokens = m.get("clobTokenIds", "[]")
                         
                         if isinstance(clob_tokens, str):
-                            clob_tokens = json.loads(clob_tokens)
+                            clob_tokens = orjson.loads(clob_tokens)
                         
                         # Get event start time for target price calculation
                         event_start_time = m.get("eventStartTime")
@@ -662,7 +791,7 @@ class MarketDiscovery:
                         if outcomes and len(outcomes) >= 2 and len(clob_tokens) >= 2:
                              # Check if first outcome is negative ("No", "Below", "Down")
                              first_outcome = str(outcomes[0]).lower()
-                             if first_outcome in ["no", "below", "down"]:
+                             if first_outcome in NEGATIVE_OUTCOMES:
                                  print(f"[MarketDiscovery] ⚠️ REVERSING token list because outcome[0] is '{outcomes[0]}'")
                                  clob_tokens = [clob_tokens[1], clob_tokens[0]]
                                  # outcomes is just checked, not returned
@@ -689,20 +818,11 @@ class MarketDiscovery:
         Extract target/strike price from market description.
         The strike is usually in the market question like "Will BTC be above $96,500 at 4:15AM?"
         """
-        import re
-        
         # Try description first, then question
         text = market.get("description", "") or market.get("question", "")
         
-        # Pattern to match dollar amounts like $96,500 or $96500.00
-        patterns = [
-            r'\$([0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]+)?)',  # $96,500.00
-            r'\$([0-9]+(?:\.[0-9]+)?)',  # $96500
-            r'above ([0-9]{1,3}(?:,[0-9]{3})*(?:\.[0-9]+)?)',  # above 96,500
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _TARGET_PRICE_PATTERNS:
+            match = pattern.search(text)
             if match:
                 price_str = match.group(1).replace(',', '')
                 try:
@@ -717,7 +837,7 @@ class MarketDiscovery5m:
     """Discover active BTC 5m markets via slug generation"""
 
     @staticmethod
-    def get_current_market() -> Optional[Dict]:
+    async def get_current_market() -> Optional[Dict]:
         """
         Get current active BTC 5m market.
         5m markets use slug format: btc-updown-5m-{start_timestamp}
@@ -727,65 +847,72 @@ class MarketDiscovery5m:
         now_ts = int(datetime.now(timezone.utc).timestamp())
         current_bucket_start = now_ts - (now_ts % interval)
 
-        # Check current bucket and next one
+        # Check current bucket and next one (probed concurrently, current preferred)
         candidates = [current_bucket_start, current_bucket_start + interval]
+        results = await asyncio.gather(
+            *(MarketDiscovery5m._probe(start_ts, interval) for start_ts in candidates)
+        )
 
-        for start_ts in candidates:
-            slug = f"btc-updown-5m-{start_ts}"
-            try:
-                url = f"https://gamma-api.polymarket.com/events?slug={slug}"
-                response = requests.get(url, timeout=5)
+        for market in results:
+            if market is not None:
+                return market
 
-                if response.status_code == 200:
-                    data = response.json()
-                    if not data:
-                        continue
+        return None
 
-                    event = data[0]
-                    markets = event.get("markets", [])
-                    if not markets:
-                        continue
+    @staticmethod
+    async def _probe(start_ts: int, interval: int) -> Optional[Dict]:
+        """Fetch one candidate 5m event; returns None if missing, closed or on error."""
+        slug = f"btc-updown-5m-{start_ts}"
+        try:
+            url = f"{GAMMA_API_URL}/events?slug={slug}"
+            data = await _get_json(url, timeout=5)
 
-                    m = markets[0]
+            if not data:
+                return None
 
-                    if m.get("closed") or m.get("resolved"):
-                        continue
+            event = data[0]
+            markets = event.get("markets", [])
+            if not markets:
+                return None
 
-                    clob_tokens = m.get("clobTokenIds", "[]")
-                    if isinstance(clob_tokens, str):
-                        clob_tokens = json.loads(clob_tokens)
-
-                    event_start_time = m.get("eventStartTime")
-                    if event_start_time:
-                        event_start_time = datetime.fromisoformat(
-                            event_start_time.replace("Z", "+00:00")
-                        )
-
-                    end_time = datetime.fromtimestamp(start_ts + interval, timezone.utc)
-                    end_date_str = m.get("endDate")
-
-                    # Ensure UP is first, DOWN is second
-                    outcomes = m.get("outcomes", [])
-                    if outcomes and len(outcomes) >= 2 and len(clob_tokens) >= 2:
-                        first_outcome = str(outcomes[0]).lower()
-                        if first_outcome in ["no", "below", "down"]:
-                            clob_tokens = [clob_tokens[1], clob_tokens[0]]
-
-                    return {
-                        "question": m.get("question"),
-                        "description": m.get("description"),
-                        "condition_id": m.get("conditionId"),
-                        "token_ids": clob_tokens,
-                        "end_date": end_date_str,
-                        "end_time": end_time,
-                        "slug": m.get("slug"),
-                        "event_start_time": event_start_time,
-                    }
+            m = markets[0]
 
-            except Exception as e:
-                pass  # Silently retry next candidate
+            if m.get("closed") or m.get("resolved"):
+                return None
 
-        return None
+            clob_tokens = m.get("clobTokenIds", "[]")
+            if isinstance(clob_tokens, str):
+                clob_tokens = orjson.loads(clob_tokens)
+
+            event_start_time = m.get("eventStartTime")
+            if event_start_time:
+                event_start_time = datetime.fromisoformat(
+                    event_start_time.replace("Z", "+00:00")
+                )
+
+            end_time = datetime.fromtimestamp(start_ts + interval, timezone.utc)
+            end_date_str = m.get("endDate")
+
+            # Ensure UP is first, DOWN is second
+            outcomes = m.get("outcomes", [])
+            if outcomes and len(outcomes) >= 2 and len(clob_tokens) >= 2:
+                first_outcome = str(outcomes[0]).lower()
+                if first_outcome in NEGATIVE_OUTCOMES:
+                    clob_tokens = [clob_tokens[1], clob_tokens[0]]
+
+            return {
+                "question": m.get("question"),
+                "description": m.get("description"),
+                "condition_id": m.get("conditionId"),
+                "token_ids": clob_tokens,
+                "end_date": end_date_str,
+                "end_time": end_time,
+                "slug": m.get("slug"),
+                "event_start_time": event_start_time,
+            }
+
+        except Exception as e:
+            return None  # Silently fall back to the other candidate
 
 
 if __name__ == "__main__":
@@ -794,7 +921,7 @@ if __name__ == "__main__":
         print("Testing data clients...")
         
         # Test market discovery
-        market = MarketDiscovery.get_current_market()
+        market = await MarketDiscovery.get_current_market()
         if market:
             print(f"\n✓ Market found: {market['question'][:60]}")
         else:
@@ -4,146 +4,361 @@ Fetches strike price from Polymarket event page HTML
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
-import json
-from typing import Optional
+import orjson
+import random
+from typing import Dict, Optional, Tuple
+from functools import lru_cache
+import threading
 import time
 from datetime import datetime, timezone
 from bs4 import BeautifulSoup
 
+try:
+    # C (Lexbor) HTML parser, much faster than bs4 for the DOM fallback
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    # libxml2 backend for BeautifulSoup when selectolax is unavailable
+    import lxml  # noqa: F401
+    _BS4_FEATURES = 'lxml'
+except ImportError:
+    _BS4_FEATURES = 'html.parser'
+
+# Upper bound for a server-provided Retry-After, so one bad header can't stall discovery
+MAX_RETRY_AFTER = 30.0
+# Transport-level retries per request (connection errors, 429/5xx)
+HTTP_RETRIES = 3
+# Per-slug target price cache: max entries, and how long a "not found" is remembered (seconds)
+PRICE_CACHE_SIZE = 1024
+NEGATIVE_CACHE_TTL = 60.0
+
+
+class _CappedRetry(Retry):
+    """urllib3 Retry whose Retry-After wait is capped at MAX_RETRY_AFTER"""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+
+_JSON_OBJECT_RE = re.compile(r'(\{.*\})')
+_BUILD_ID_RE = re.compile(rb'"buildId":"([^"]+)"')
+_NEXT_DATA_RE = re.compile(rb'<script[^>]*\bid="__NEXT_DATA__"[^>]*>(.*?)</script>', re.DOTALL)
+_SCRIPT_RE = re.compile(r'<script[^>]*>(.*?)</script>', re.DOTALL)
+_PRICE_TO_BEAT_RE = re.compile(r'Price to beat', re.IGNORECASE)
+_PRICE_TO_BEAT_BYTES_RE = re.compile(rb'Price to beat', re.IGNORECASE)
+_PRICE_TO_BEAT_TEXT_RE = re.compile(r'Price to beat[^\$]*\$\s*([\d,]+\.?\d*)', re.IGNORECASE)
+_DOLLAR_AMOUNT_RE = re.compile(r'\$\s*([\d,]+\.?\d*)')
+# "Price to beat" / "Strike price" label followed by a dollar amount
+_LABEL_PRICE_PATTERNS = [
+    re.compile(rb'Price to beat[^\$]*\$\s*([\d,]+\.?\d*)', re.IGNORECASE | re.DOTALL),
+    re.compile(rb'Strike price[^\$]*\$\s*([\d,]+\.?\d*)', re.IGNORECASE | re.DOTALL),
+]
+
+
+@lru_cache(maxsize=128)
+def _slug_price_re(slug: str) -> re.Pattern:
+    """Slug-anchored openPrice pattern (over response bytes), compiled once per slug."""
+    # Bounded gap so a miss can't scan (and backtrack over) the rest of a huge line
+    return re.compile(b'"' + re.escape(slug.encode()) + rb'"[^\n]{0,4096}?"openPrice":\s*([\d.]+)')
+
+
+def _iter_open_price(obj):
+    """Yield every dict with a truthy openPrice, depth-first in document order (no recursion)."""
+    stack = [obj]
+    pop, extend = stack.pop, stack.extend
+    while stack:
+        cur = pop()
+        if isinstance(cur, dict):
+            if cur.get('openPrice'):
+                yield cur
+            extend(reversed(cur.values()))
+        elif isinstance(cur, list):
+            extend(reversed(cur))
+
+
 class PolymarketTargetPriceAPI:
     def __init__(self):
         self.session = requests.Session()
+        # HTTP-level failures (dropped connections, 429/5xx) are retried by urllib3 with
+        # exponential backoff, honoring Retry-After; the final response is returned as-is
+        retry = _CappedRetry(total=HTTP_RETRIES, backoff_factor=0.5,
+                             status_forcelist=[429, 500, 502, 503, 504],
+                             allowed_methods=['GET', 'HEAD'], raise_on_status=False)
+        # 15m and 5m discovery can fetch concurrently (worker threads); keep
+        # enough pooled keep-alive sockets that neither opens a fresh TLS session
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Connection': 'keep-alive',
         })
+        # slug -> (price, expires_at); expires_at is None for found prices (immutable)
+        self._price_cache: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        self._cache_lock = threading.Lock()
+        # Next.js buildId, learned from the first event page; enables the JSON data endpoint
+        self._build_id: Optional[str] = None
+
+    def warm_up(self, timeout: float = 2):
+        """Open a pooled keep-alive connection to polymarket.com (best effort)."""
+        try:
+            self.session.head('https://polymarket.com', timeout=timeout)
+        except requests.RequestException:
+            pass
+
+    @staticmethod
+    def _retry_delay(attempt: int) -> float:
+        """Seconds to wait before re-reading a page that had no price yet (jittered exponential backoff)."""
+        return 2 ** attempt + random.uniform(0, 1)
     
+    @staticmethod
+    def _iter_scripts(html: str, tree=None):
+        """Yield <script> bodies lazily, from the parsed tree when available."""
+        if tree is not None:
+            for node in tree.css('script'):
+                yield node.text(deep=True, strip=False)
+        else:
+            for match in _SCRIPT_RE.finditer(html):
+                yield match.group(1)
+
+    @staticmethod
+    def _price_from_dom(html, tree=None) -> Optional[float]:
+        """Find the dollar amount next to a "Price to beat" label in the rendered text."""
+        try:
+            if LexborHTMLParser is not None:
+                if tree is None:
+                    tree = LexborHTMLParser(html)
+                root = tree.body or tree.root
+                if root is None:
+                    return None
+                match = _PRICE_TO_BEAT_TEXT_RE.search(root.text(separator=' '))
+                if match:
+                    price = float(match.group(1).replace(',', ''))
+                    if price > 0:
+                        return price
+                return None
+
+            soup = BeautifulSoup(html, _BS4_FEATURES)
+            for element in soup.find_all(string=_PRICE_TO_BEAT_RE):
+                parent_text = element.parent.get_text() if element.parent else str(element)
+                match = _DOLLAR_AMOUNT_RE.search(parent_text)
+                if match:
+                    price_str = match.group(1).replace(',', '')
+                    try:
+                        price = float(price_str)
+                        if price > 0:
+                            return price
+                    except ValueError:
+                        continue
+        except Exception:
+            pass
+        return None
+    
+    def _price_from_data_endpoint(self, slug: str, slug_lower: str, target_ts_str: Optional[str],
+                                  target_formats: list) -> Tuple[Optional[float], bool]:
+        """Read the event's page state from /_next/data/<buildId>/event/<slug>.json.
+
+        Returns ``(price, state_decoded)``: ``(None, True)`` means the state is
+        current but carries no price yet, ``(None, False)`` that the endpoint
+        was unusable and the HTML page should be tried instead.
+        """
+        build_id = self._build_id
+        url = f'https://polymarket.com/_next/data/{build_id}/event/{slug}.json'
+        try:
+            response = self.session.get(url, timeout=10)
+        except requests.RequestException:
+            return None, False
+        if response.status_code == 404:
+            # Build rotated: forget the id, the HTML path will pick up the new one
+            if self._build_id == build_id:
+                self._build_id = None
+            return None, False
+        if response.status_code != 200:
+            return None, False
+        try:
+            page_props = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            return None, False
+        # Same shape as __NEXT_DATA__ ({"props": {"pageProps": ...}})
+        return self._price_from_next_data({'props': page_props}, slug_lower, target_ts_str, target_formats), True
+
+    @staticmethod
+    def _price_from_next_data(data, slug_lower: str, target_ts_str: Optional[str],
+                              target_formats: list) -> Optional[float]:
+        """Find our market's openPrice in the Next.js page state."""
+        # Walk objects carrying openPrice in document order; first match by slug or ticker wins
+        for p_obj in _iter_open_price(data):
+            # 1. Direct Slug Match (Highest Priority)
+            obj_slug = str(p_obj.get('slug', '')).lower()
+            if obj_slug == slug_lower:
+                return float(p_obj['openPrice'])
+            
+            # 2. Ticker match (often used in Polymarket JSON)
+            obj_ticker = str(p_obj.get('ticker', '')).lower()
+            if target_ts_str and target_ts_str in obj_ticker:
+                return float(p_obj['openPrice'])
+
+        # Check dehydratedState queries for crypto-prices by timestamp
+        # This is where "Price to beat" is usually stored
+        try:
+            queries = data.get('props', {}).get('pageProps', {}).get('dehydratedState', {}).get('queries', [])
+            target_formats_lower = [fmt.lower() for fmt in target_formats]
+            for q in queries:
+                query_key = str(q.get('queryKey', '')).lower()
+                q_state = q.get('state', {})
+                q_data = q_state.get('data', {})
+                
+                # Look for crypto-prices query matching our target timestamp
+                if 'crypto-prices' in query_key and any(fmt in query_key for fmt in target_formats_lower):
+                    if isinstance(q_data, dict) and 'openPrice' in q_data:
+                        return float(q_data['openPrice'])
+                
+                # Fallback: check slug in query data
+                if isinstance(q_data, list):
+                    for item in q_data:
+                        if isinstance(item, dict) and str(item.get('slug', '')).lower() == slug_lower:
+                            if 'openPrice' in item: return float(item['openPrice'])
+                elif isinstance(q_data, dict):
+                    if str(q_data.get('slug', '')).lower() == slug_lower:
+                        if 'openPrice' in q_data: return float(q_data['openPrice'])
+        except:
+            pass
+        return None
+
     def get_target_price(self, slug: str, max_retries: int = 3) -> Optional[float]:
+        """
+        Strike price for a market slug, cached per slug.
+        A market's openPrice never changes once published, so hits are kept;
+        misses are remembered for NEGATIVE_CACHE_TTL to avoid re-fetching during rollover.
+        """
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._price_cache.get(slug)
+        if cached is not None:
+            price, expires_at = cached
+            if expires_at is None or now < expires_at:
+                return price
+
+        price = self._fetch_target_price(slug, max_retries)
+
+        with self._cache_lock:
+            self._price_cache.pop(slug, None)
+            self._price_cache[slug] = (price, None if price is not None else time.monotonic() + NEGATIVE_CACHE_TTL)
+            # Bounded: drop the oldest entries (dicts keep insertion order)
+            while len(self._price_cache) > PRICE_CACHE_SIZE:
+                del self._price_cache[next(iter(self._price_cache))]
+        return price
+
+    def _fetch_target_price(self, slug: str, max_retries: int = 3) -> Optional[float]:
         """
         Parse strike price from Polymarket event page HTML.
         Uses timestamp from slug and robust JSON traversal to find the correct openPrice.
         """
         # Extract timestamp from slug (e.g., btc-updown-15m-1769206500 -> 1769206500)
-        ts_match = re.search(r'-(\d+)$', slug)
-        target_ts_str = ts_match.group(1) if ts_match else None
+        tail = slug.rsplit('-', 1)[-1]
+        target_ts_str = tail if tail.isdigit() else None
         
         # Possible time formats in Polymarket JSON
         target_formats = []
         if target_ts_str:
             try:
                 target_ts_int = int(target_ts_str)
-                dt = datetime.fromtimestamp(target_ts_int, tz=timezone.utc)
-                target_formats.append(dt.strftime('%Y-%m-%dT%H:%M:%S'))
-                target_formats.append(dt.strftime('%Y-%m-%dT%H:%M:%SZ'))
-                target_formats.append(dt.strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+                # One C-level isoformat(); the variants only differ by suffix
+                iso = datetime.fromtimestamp(target_ts_int, tz=timezone.utc).replace(tzinfo=None).isoformat(timespec='seconds')
                 # Also include the raw timestamp as string
-                target_formats.append(target_ts_str)
+                target_formats = [iso, iso + 'Z', iso + '.000Z', target_ts_str]
             except:
                 pass
 
+        slug_lower = slug.lower()
+        match_keys = [slug_lower] + target_formats
+
         for attempt in range(max_retries):
             try:
+                # Method 0: Next.js data endpoint (page state as JSON, no HTML to parse)
+                if self._build_id:
+                    price, state_decoded = self._price_from_data_endpoint(slug, slug_lower, target_ts_str, target_formats)
+                    if price is not None:
+                        return price
+                    if state_decoded:
+                        # Price not published yet; the HTML page embeds the same
+                        # state, so wait and re-read instead of downloading it
+                        if attempt < max_retries - 1:
+                            time.sleep(self._retry_delay(attempt))
+                        continue
+
                 url = f'https://polymarket.com/event/{slug}'
+                # Transport retries already happened inside the session adapter
                 response = self.session.get(url, timeout=10)
                 
                 if response.status_code != 200:
-                    if attempt < max_retries - 1:
-                        time.sleep(2)
-                        continue
                     return None
                 
-                html = response.text
-                
-                # Method 1: Deep JSON Traversal
-                try:
-                    scripts = re.findall(r'<script[^>]*>(.*?)</script>', html, re.DOTALL)
-                    for script in scripts:
-                        if '"openPrice"' in script:
-                            try:
-                                json_match = re.search(r'(\{.*\})', script)
-                                if json_match:
-                                    data = json.loads(json_match.group(1))
-                                    
-                                    # State for recursive search
-                                    found_prices = []
-
-                                    def find_prices_recursive(obj, context=None):
-                                        if isinstance(obj, dict):
-                                            # If we find openPrice, record it with its context (the whole object)
-                                            if 'openPrice' in obj and obj['openPrice']:
-                                                found_prices.append(obj)
-                                            
-                                            for k, v in obj.items():
-                                                find_prices_recursive(v, obj)
-                                        elif isinstance(obj, list):
-                                            for item in obj:
-                                                find_prices_recursive(item, obj)
-
-                                    find_prices_recursive(data)
-
-                                    # Filter found prices by our slug or ticker
-                                    for p_obj in found_prices:
-                                        # 1. Direct Slug Match (Highest Priority)
-                                        obj_slug = str(p_obj.get('slug', '')).lower()
-                                        if obj_slug == slug.lower():
-                                            return float(p_obj['openPrice'])
-                                        
-                                        # 2. Ticker match (often used in Polymarket JSON)
-                                        obj_ticker = str(p_obj.get('ticker', '')).lower()
-                                        if target_ts_str and target_ts_str in obj_ticker:
-                                            return float(p_obj['openPrice'])
-
-                                    # Method 2: Check dehydratedState queries for crypto-prices by timestamp
-                                    # This is where "Price to beat" is usually stored
-                                    try:
-                                        queries = data.get('props', {}).get('pageProps', {}).get('dehydratedState', {}).get('queries', [])
-                                        for q in queries:
-                                            query_key = str(q.get('queryKey', ''))
-                                            q_state = q.get('state', {})
-                                            q_data = q_state.get('data', {})
-                                            
-                                            # Look for crypto-prices query matching our target timestamp
-                                            is_crypto_price_query = 'crypto-prices' in query_key.lower()
-                                            matches_timestamp = any(fmt.lower() in query_key.lower() for fmt in target_formats)
-                                            
-                                            if is_crypto_price_query and matches_timestamp:
-                                                if isinstance(q_data, dict) and 'openPrice' in q_data:
-                                                    return float(q_data['openPrice'])
-                                            
-                                            # Fallback: check slug in query data
-                                            if isinstance(q_data, list):
-                                                for item in q_data:
-                                                    if isinstance(item, dict) and str(item.get('slug', '')).lower() == slug.lower():
-                                                        if 'openPrice' in item: return float(item['openPrice'])
-                                            elif isinstance(q_data, dict):
-                                                if str(q_data.get('slug', '')).lower() == slug.lower():
-                                                    if 'openPrice' in q_data: return float(q_data['openPrice'])
-                                    except:
-                                        pass
-                            except:
-                                pass
-                except Exception:
-                    pass
-
-                # Method 2: High-accuracy regex (slug-anchored)
+                # Raw bytes: no full-body decode for the regex / JSON paths
+                body = response.content
+                if not self._build_id:
+                    build_match = _BUILD_ID_RE.search(body)
+                    if build_match:
+                        self._build_id = build_match.group(1).decode()
+                # Method 1: High-accuracy regex (slug-anchored), a single C-level scan
                 # Matches: "slug":"...slug...","openPrice":89123.45
-                price_match = re.search(fr'"{re.escape(slug)}".*?"openPrice":\s*([\d.]+)', html)
+                price_match = _slug_price_re(slug).search(body)
                 if price_match:
                     return float(price_match.group(1))
                 
+                # Method 2: Deep JSON Traversal
+                tree = None
+                # Only a well-formed page state without our price is worth re-reading
+                # (price not published yet); a missing or undecodable state won't fix itself
+                state_pending = False
+                next_match = _NEXT_DATA_RE.search(body)
+                if next_match is not None:
+                    # The page state lives in __NEXT_DATA__: decode it once, straight from bytes
+                    try:
+                        data = orjson.loads(next_match.group(1))
+                    except orjson.JSONDecodeError:
+                        data = None
+                    if data is not None:
+                        price = self._price_from_next_data(data, slug_lower, target_ts_str, target_formats)
+                        if price is not None:
+                            return price
+                        state_pending = True
+                else:
+                    # No __NEXT_DATA__: scan every inline script instead
+                    html = response.text
+                    # One C-parsed tree shared by the script scan and the DOM fallback
+                    tree = LexborHTMLParser(html) if LexborHTMLParser is not None else None
+                    try:
+                        for script in self._iter_scripts(html, tree):
+                            # Cheap C-level substring gates before any JSON parse / traversal:
+                            # a match needs openPrice plus our slug or one of the target time formats
+                            if '"openPrice"' in script and any(key in script for key in match_keys):
+                                try:
+                                    json_match = _JSON_OBJECT_RE.search(script)
+                                    if json_match:
+                                        data = orjson.loads(json_match.group(1))
+                                        price = self._price_from_next_data(data, slug_lower, target_ts_str, target_formats)
+                                        if price is not None:
+                                            return price
+                                except:
+                                    pass
+                    except Exception:
+                        pass
+
                 # Method 3: Legacy Regex/BeautifulSoup for "Price to beat" (as last resort)
-                # ... (rest of the code remains as fallback)
                 # We try to find "Price to beat" or "Strike price"
-                patterns = [
-                    r'Price to beat[^\$]*\$\s*([\d,]+\.?\d*)',
-                    r'price to beat[^\$]*\$\s*([\d,]+\.?\d*)',
-                    r'Strike price[^\$]*\$\s*([\d,]+\.?\d*)',
-                ]
-                
-                for pattern in patterns:
-                    match = re.search(pattern, html, re.IGNORECASE | re.DOTALL)
+                for pattern in _LABEL_PRICE_PATTERNS:
+                    match = pattern.search(body)
                     if match:
-                        price_str = match.group(1).replace(',', '')
+                        price_str = match.group(1).replace(b',', b'')
                         try:
                             price = float(price_str)
                             if price > 0 and price < 1000000:
@@ -151,29 +366,23 @@ class PolymarketTargetPriceAPI:
                         except ValueError:
                             continue
                 
-                # Method 3: BeautifulSoup parsing for "Price to beat"
-                try:
-                    soup = BeautifulSoup(html, 'html.parser')
-                    for element in soup.find_all(string=re.compile(r'Price to beat', re.IGNORECASE)):
-                        parent_text = element.parent.get_text() if element.parent else str(element)
-                        match = re.search(r'\$\s*([\d,]+\.?\d*)', parent_text)
-                        if match:
-                            price_str = match.group(1).replace(',', '')
-                            try:
-                                price = float(price_str)
-                                if price > 0:
-                                    return price
-                            except ValueError:
-                                continue
-                except Exception:
-                    pass
+                # Method 3: DOM parsing for "Price to beat" (skipped if the label isn't on the page)
+                if _PRICE_TO_BEAT_BYTES_RE.search(body):
+                    # selectolax / BeautifulSoup take bytes and detect the charset themselves
+                    price = self._price_from_dom(body, tree)
+                    if price is not None:
+                        return price
                 
+                if not state_pending:
+                    return None
                 if attempt < max_retries - 1:
-                    time.sleep(2)
+                    time.sleep(self._retry_delay(attempt))
                 
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    time.sleep(2)
-                    continue
+            except requests.RequestException:
+                # Network failure that survived the adapter's retries
+                return None
+            except Exception:
+                # Deterministic parse failure: retrying the same page won't help
+                return None
         
         return None
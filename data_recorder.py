@@ -12,40 +12,59 @@ import time
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Optional, List
 from pathlib import Path
-from collections import deque
+from collections import deque, OrderedDict
 
 # Add project root to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from data.clients import BinanceClient, CLOBClient, RTDSClient, MarketDiscovery, MarketDiscovery5m
+from data.clients import (
+    BinanceClient, CLOBClient, RTDSClient, MarketDiscovery, MarketDiscovery5m,
+    warm_up_http_session, close_http_session,
+)
 from data.polymarket_target_api import PolymarketTargetPriceAPI
 from db import DBWriter
 
 import builtins
 
+# Snapshot quote tuple used until the first CLOB update for a market
+_NO_PRICES = (0, 0, 0, 0, 0, 0)
+
+# Windows console API, bound once at import with explicit signatures
+if os.name == 'nt':
+    from ctypes import wintypes
+    _kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    _GetStdHandle = _kernel32.GetStdHandle
+    _GetStdHandle.argtypes = [wintypes.DWORD]
+    _GetStdHandle.restype = wintypes.HANDLE
+    _GetConsoleMode = _kernel32.GetConsoleMode
+    _GetConsoleMode.argtypes = [wintypes.HANDLE, ctypes.POINTER(wintypes.DWORD)]
+    _GetConsoleMode.restype = wintypes.BOOL
+    _SetConsoleMode = _kernel32.SetConsoleMode
+    _SetConsoleMode.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+    _SetConsoleMode.restype = wintypes.BOOL
+
 def disable_quick_edit():
     """Disable QuickEdit mode and enable ANSI support in Windows console"""
     if os.name == 'nt':
         try:
-            kernel32 = ctypes.windll.kernel32
             # Handle for Stdin (-10)
-            h_stdin = kernel32.GetStdHandle(-10)
-            mode = ctypes.c_uint()
-            kernel32.GetConsoleMode(h_stdin, ctypes.byref(mode))
+            h_stdin = _GetStdHandle(-10)
+            mode = wintypes.DWORD()
+            _GetConsoleMode(h_stdin, ctypes.byref(mode))
             
             # ENABLE_QUICK_EDIT_MODE = 0x0040
             # ENABLE_EXTENDED_FLAGS = 0x0080
             # To disable QuickEdit, we must clear 0x0040 and ENSURE 0x0080 is set
             new_mode = mode.value & ~0x0040
             new_mode |= 0x0080 
-            kernel32.SetConsoleMode(h_stdin, new_mode)
+            _SetConsoleMode(h_stdin, new_mode)
             
             # Handle for Stdout (-11) to enable ANSI (\033 codes)
-            h_stdout = kernel32.GetStdHandle(-11)
-            o_mode = ctypes.c_uint()
-            kernel32.GetConsoleMode(h_stdout, ctypes.byref(o_mode))
+            h_stdout = _GetStdHandle(-11)
+            o_mode = wintypes.DWORD()
+            _GetConsoleMode(h_stdout, ctypes.byref(o_mode))
             # 0x0004: ENABLE_VIRTUAL_TERMINAL_PROCESSING
-            kernel32.SetConsoleMode(h_stdout, o_mode.value | 0x0004)
+            _SetConsoleMode(h_stdout, o_mode.value | 0x0004)
         except Exception:
             pass
 
@@ -58,25 +77,29 @@ class DataRecorder:
         
         # State
         self.running = False
-        self.start_time = datetime.now(timezone.utc)
+        self.start_ts = time.time()
+        self._next_rotation_ts = 0.0  # next UTC midnight, set on first rotation check
         self.current_date = None
         self.db_writer = DBWriter()
         
         # Market Data - 15m
         self.current_market = None
-        self.market_history = {} # slug -> token_ids cache for resolution matching
+        self.market_history = OrderedDict() # slug -> token_ids cache for resolution matching
         self.binance_price = None
         self.oracle_price = None
         self.target_price = None
         self.up_prices = None
         self.down_prices = None
+        # (up_bid, up_ask, up_mid, down_bid, down_ask, down_mid) for snapshots
+        self.snap_prices = _NO_PRICES
         
         # Market Data - 5m
         self.current_market_5m = None
-        self.market_history_5m = {}
+        self.market_history_5m = OrderedDict()
         self.target_price_5m = None
         self.up_prices_5m = None
         self.down_prices_5m = None
+        self.snap_prices_5m = _NO_PRICES
         
         # Order book data
         self.orderbook_15m = None
@@ -93,6 +116,15 @@ class DataRecorder:
         
         # BTC price recording throttle (record ~3Hz, not every tick)
         self.last_btc_record_ts = 0
+
+        # Main loop cadence (~3Hz snapshots)
+        self.snapshot_interval = 0.33
+        # Unchanged rows are skipped, but still written this often (seconds)
+        self.snapshot_heartbeat = 5.0
+        self._last_recorded = {}  # table -> (signature, ts)
+        # Console status redraw rate (seconds)
+        self.display_interval = 1.0
+        self._last_render = 0.0
         
         # Health & Latency
         self.errors = []
@@ -102,7 +134,11 @@ class DataRecorder:
             'clob': 0,
             'clob_5m': 0
         }
-        self.bnc_history = deque(maxlen=100000) # Increased for consistent history across bots
+        # Binance ticks inside the lag-matching window only, kept as parallel
+        # timestamp / price deques so no tuple is allocated per tick
+        self.lag_window = 10.0
+        self.bnc_ts = deque()
+        self.bnc_px = deque()
         self.current_lag_ms = 0
         
         # Clients
@@ -115,16 +151,25 @@ class DataRecorder:
         self.binance_price = price
         now = time.time()
         self.last_update_ts['binance'] = now
-        self.bnc_history.append((now, price))
+        bnc_ts = self.bnc_ts
+        bnc_ts.append(now)
+        self.bnc_px.append(price)
+        # Evict ticks that fell out of the lag window
+        cutoff = now - self.lag_window
+        while bnc_ts[0] < cutoff:
+            bnc_ts.popleft()
+            self.bnc_px.popleft()
         
     def on_clob_update(self, market_slug: str, up_prices: Dict, down_prices: Dict):
         if self.current_market and market_slug == self.current_market['slug']:
             self.up_prices = up_prices
             self.down_prices = down_prices
+            self.snap_prices = self._snap_prices(up_prices, down_prices)
             self.last_update_ts['clob'] = time.time()
         if self.current_market_5m and market_slug == self.current_market_5m['slug']:
             self.up_prices_5m = up_prices
             self.down_prices_5m = down_prices
+            self.snap_prices_5m = self._snap_prices(up_prices, down_prices)
             self.last_update_ts['clob_5m'] = time.time()
     
     def on_orderbook_update(self, market_slug: str, orderbook: Dict):
@@ -133,6 +178,57 @@ class DataRecorder:
         if self.current_market_5m and market_slug == self.current_market_5m['slug']:
             self.orderbook_5m = orderbook
 
+    def _changed(self, table: str, sig: tuple, now_ts: float) -> bool:
+        """True if *sig* differs from the last row recorded to *table*, or
+        the heartbeat interval has passed since then"""
+        last = self._last_recorded.get(table)
+        if last and last[0] == sig and now_ts - last[1] < self.snapshot_heartbeat:
+            return False
+        self._last_recorded[table] = (sig, now_ts)
+        return True
+
+    @staticmethod
+    def _snap_prices(up: Dict, down: Dict) -> tuple:
+        """Flatten up/down quotes into the tuple record_snapshot writes"""
+        up = up or {}
+        down = down or {}
+        return (up.get("bid", 0), up.get("ask", 0), up.get("mid", 0),
+                down.get("bid", 0), down.get("ask", 0), down.get("mid", 0))
+
+    def _make_snap(self, ts_us: int, now_ts: float, market: Dict,
+                   prices: tuple, target_price: Optional[float]) -> Dict:
+        """Build a market_snapshots_* row (shared by the 15m and 5m markets)"""
+        up_bid, up_ask, up_mid, down_bid, down_ask, down_mid = prices
+        end_time = market.get('end_time')
+        return {
+            "timestamp": ts_us,
+            "market_slug": market['slug'],
+            "oracle_price": self.oracle_price,
+            "binance_price": self.binance_price,
+            "up_bid": up_bid,
+            "up_ask": up_ask,
+            "up_mid": up_mid,
+            "down_bid": down_bid,
+            "down_ask": down_ask,
+            "down_mid": down_mid,
+            "time_to_expiry": int(end_time.timestamp() - now_ts) if end_time else 0,
+            "target_price": target_price,
+            "lag_ms": self.current_lag_ms
+        }
+
+    def _make_orderbook(self, ts_us: int, slug: str, ob: Dict) -> Dict:
+        """Build an orderbook_* row with its volume totals"""
+        record = {
+            "timestamp": ts_us,
+            "market_slug": slug,
+            "up_bids": ob.get("up_bids", []),
+            "up_asks": ob.get("up_asks", []),
+            "down_bids": ob.get("down_bids", []),
+            "down_asks": ob.get("down_asks", []),
+        }
+        record.update(self._orderbook_totals(ob))
+        return record
+
     @staticmethod
     def _orderbook_totals(ob: Dict) -> Dict:
         """Calculate volume totals for an order book snapshot"""
@@ -149,15 +245,15 @@ class DataRecorder:
         self.last_update_ts['oracle'] = now
         
         # Calculate lag: find when this price first appeared on Binance
-        if self.bnc_history:
+        if self.bnc_ts:
             # Simple correlation: find first BNC price within 10s that matches ORC
             # In practice, oracle might be slightly different, so we find closest match
             best_match_ts = None
             min_diff = float('inf')
             
-            for b_ts, b_price in reversed(self.bnc_history):
-                # Only look back up to 10 seconds
-                if now - b_ts > 10: break
+            for b_ts, b_price in zip(reversed(self.bnc_ts), reversed(self.bnc_px)):
+                # Only look back up to the lag window
+                if now - b_ts > self.lag_window: break
                 
                 diff = abs(b_price - oracle_price)
                 if diff < min_diff:
@@ -200,7 +296,7 @@ class DataRecorder:
         if self.current_date:
             try:
                 self.db_writer.add("system_events", {
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "timestamp": time.time_ns() // 1000,
                     "event_type": event_type,
                     "message": message
                 })
@@ -208,13 +304,19 @@ class DataRecorder:
                 self.errors.append(f"JSON Write Error: {e}")
         
         # Output to console
-        curr_time = datetime.now().strftime('%H:%M:%S')
+        curr_time = time.strftime('%H:%M:%S')
         sys.stdout.write("\r" + " " * 125 + "\r")
         sys.stdout.write(f"[{curr_time}] [{event_type.upper()}] {message}\n")
         sys.stdout.flush()
 
     async def check_date_rotation(self):
-        now_date = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        # Runs every tick; only look at the calendar once the UTC day is over
+        if time.time() < self._next_rotation_ts:
+            return
+        now = datetime.now(timezone.utc)
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        self._next_rotation_ts = (midnight + timedelta(days=1)).timestamp()
+        now_date = now.strftime("%Y-%m-%d")
         if now_date != self.current_date:
             self.current_date = now_date
             data_dir = os.path.join(self.snapshots_dir, now_date)
@@ -223,7 +325,7 @@ class DataRecorder:
 
     async def update_market_discovery(self):
         try:
-            market = await asyncio.to_thread(MarketDiscovery.get_current_market)
+            market = await MarketDiscovery.get_current_market()
             if market and (not self.current_market or market['slug'] != self.current_market['slug']):
                 slug = market['slug']
 
@@ -239,6 +341,7 @@ class DataRecorder:
                         self.skipped_market_15m = True
                         self.up_prices = None
                         self.down_prices = None
+                        self.snap_prices = _NO_PRICES
                         self.orderbook_15m = None
                         return
 
@@ -248,9 +351,9 @@ class DataRecorder:
                 
                 # Save to history for resolution matching
                 self.market_history[slug] = token_ids
+                self.market_history.move_to_end(slug)
                 if len(self.market_history) > 20:
-                    oldest_slug = next(iter(self.market_history))
-                    del self.market_history[oldest_slug]
+                    self.market_history.popitem(last=False)
                 
                 self.clob_client.set_market(token_ids, slug)
                 self.target_price = await asyncio.to_thread(self.polymarket_api.get_target_price, slug)
@@ -260,7 +363,7 @@ class DataRecorder:
 
     async def update_market_discovery_5m(self):
         try:
-            market = await asyncio.to_thread(MarketDiscovery5m.get_current_market)
+            market = await MarketDiscovery5m.get_current_market()
             if market and (not self.current_market_5m or market['slug'] != self.current_market_5m['slug']):
                 slug = market['slug']
 
@@ -275,6 +378,7 @@ class DataRecorder:
                         self.skipped_market_5m = True
                         self.up_prices_5m = None
                         self.down_prices_5m = None
+                        self.snap_prices_5m = _NO_PRICES
                         self.orderbook_5m = None
                         return
 
@@ -283,9 +387,9 @@ class DataRecorder:
                 token_ids = market['token_ids']
                 
                 self.market_history_5m[slug] = token_ids
+                self.market_history_5m.move_to_end(slug)
                 if len(self.market_history_5m) > 40:
-                    oldest_slug = next(iter(self.market_history_5m))
-                    del self.market_history_5m[oldest_slug]
+                    self.market_history_5m.popitem(last=False)
                 
                 self.clob_client.set_market(token_ids, slug)
                 self.target_price_5m = await asyncio.to_thread(self.polymarket_api.get_target_price, slug)
@@ -297,14 +401,15 @@ class DataRecorder:
         if not self.current_date:
             return
 
-        now_utc = datetime.now(timezone.utc)
-        now_ts = time.time()
-        ts_iso = now_utc.isoformat()
+        # One clock read; rows store epoch µs, no datetime on the write path
+        ts_us = time.time_ns() // 1000
+        now_ts = ts_us / 1_000_000
 
         # Record BTC prices (~3Hz, shared for both market types)
-        if now_ts - self.last_btc_record_ts >= 0.3 and (self.binance_price or self.oracle_price):
+        if (now_ts - self.last_btc_record_ts >= 0.3 and (self.binance_price or self.oracle_price)
+                and self._changed("btc_prices", (self.binance_price, self.oracle_price), now_ts)):
             self.db_writer.add("btc_prices", {
-                "timestamp": ts_iso,
+                "timestamp": ts_us,
                 "binance_price": self.binance_price,
                 "oracle_price": self.oracle_price,
                 "lag_ms": self.current_lag_ms
@@ -312,78 +417,42 @@ class DataRecorder:
             self.last_btc_record_ts = now_ts
 
         # Record 15m market snapshot
-        if self.current_market and not self.skipped_market_15m:
+        if self.current_market and not self.skipped_market_15m and self._changed(
+                "market_snapshots_15m",
+                (self.current_market['slug'], self.binance_price, self.oracle_price,
+                 self.target_price, self.snap_prices), now_ts):
             try:
-                self.db_writer.add("market_snapshots_15m", {
-                    "timestamp": ts_iso,
-                    "market_slug": self.current_market['slug'],
-                    "oracle_price": self.oracle_price,
-                    "binance_price": self.binance_price,
-                    "up_bid": self.up_prices.get("bid", 0) if self.up_prices else 0,
-                    "up_ask": self.up_prices.get("ask", 0) if self.up_prices else 0,
-                    "up_mid": self.up_prices.get("mid", 0) if self.up_prices else 0,
-                    "down_bid": self.down_prices.get("bid", 0) if self.down_prices else 0,
-                    "down_ask": self.down_prices.get("ask", 0) if self.down_prices else 0,
-                    "down_mid": self.down_prices.get("mid", 0) if self.down_prices else 0,
-                    "time_to_expiry": int((self.current_market['end_time'] - now_utc).total_seconds()) if 'end_time' in self.current_market else 0,
-                    "target_price": self.target_price,
-                    "lag_ms": self.current_lag_ms
-                })
+                self.db_writer.add("market_snapshots_15m", self._make_snap(
+                    ts_us, now_ts, self.current_market, self.snap_prices, self.target_price))
             except Exception as e:
                 self.errors.append(f"15m Snapshot Error: {e}")
 
         # Record 15m order book distribution
-        if self.current_market and not self.skipped_market_15m and self.orderbook_15m:
+        if (self.current_market and not self.skipped_market_15m and self.orderbook_15m
+                and self._changed("orderbook_15m", (self.current_market['slug'], self.orderbook_15m), now_ts)):
             try:
-                ob = self.orderbook_15m
-                record = {
-                    "timestamp": ts_iso,
-                    "market_slug": self.current_market['slug'],
-                    "up_bids": ob.get("up_bids", []),
-                    "up_asks": ob.get("up_asks", []),
-                    "down_bids": ob.get("down_bids", []),
-                    "down_asks": ob.get("down_asks", []),
-                }
-                record.update(self._orderbook_totals(ob))
-                self.db_writer.add("orderbook_15m", record)
+                self.db_writer.add("orderbook_15m", self._make_orderbook(
+                    ts_us, self.current_market['slug'], self.orderbook_15m))
             except Exception as e:
                 self.errors.append(f"15m Orderbook Error: {e}")
 
         # Record 5m market snapshot
-        if self.current_market_5m and not self.skipped_market_5m:
+        if self.current_market_5m and not self.skipped_market_5m and self._changed(
+                "market_snapshots_5m",
+                (self.current_market_5m['slug'], self.binance_price, self.oracle_price,
+                 self.target_price_5m, self.snap_prices_5m), now_ts):
             try:
-                self.db_writer.add("market_snapshots_5m", {
-                    "timestamp": ts_iso,
-                    "market_slug": self.current_market_5m['slug'],
-                    "oracle_price": self.oracle_price,
-                    "binance_price": self.binance_price,
-                    "up_bid": self.up_prices_5m.get("bid", 0) if self.up_prices_5m else 0,
-                    "up_ask": self.up_prices_5m.get("ask", 0) if self.up_prices_5m else 0,
-                    "up_mid": self.up_prices_5m.get("mid", 0) if self.up_prices_5m else 0,
-                    "down_bid": self.down_prices_5m.get("bid", 0) if self.down_prices_5m else 0,
-                    "down_ask": self.down_prices_5m.get("ask", 0) if self.down_prices_5m else 0,
-                    "down_mid": self.down_prices_5m.get("mid", 0) if self.down_prices_5m else 0,
-                    "time_to_expiry": int((self.current_market_5m['end_time'] - now_utc).total_seconds()) if 'end_time' in self.current_market_5m else 0,
-                    "target_price": self.target_price_5m,
-                    "lag_ms": self.current_lag_ms
-                })
+                self.db_writer.add("market_snapshots_5m", self._make_snap(
+                    ts_us, now_ts, self.current_market_5m, self.snap_prices_5m, self.target_price_5m))
             except Exception as e:
                 self.errors.append(f"5m Snapshot Error: {e}")
 
         # Record 5m order book distribution
-        if self.current_market_5m and not self.skipped_market_5m and self.orderbook_5m:
+        if (self.current_market_5m and not self.skipped_market_5m and self.orderbook_5m
+                and self._changed("orderbook_5m", (self.current_market_5m['slug'], self.orderbook_5m), now_ts)):
             try:
-                ob = self.orderbook_5m
-                record = {
-                    "timestamp": ts_iso,
-                    "market_slug": self.current_market_5m['slug'],
-                    "up_bids": ob.get("up_bids", []),
-                    "up_asks": ob.get("up_asks", []),
-                    "down_bids": ob.get("down_bids", []),
-                    "down_asks": ob.get("down_asks", []),
-                }
-                record.update(self._orderbook_totals(ob))
-                self.db_writer.add("orderbook_5m", record)
+                self.db_writer.add("orderbook_5m", self._make_orderbook(
+                    ts_us, self.current_market_5m['slug'], self.orderbook_5m))
             except Exception as e:
                 self.errors.append(f"5m Orderbook Error: {e}")
 
@@ -396,15 +465,18 @@ class DataRecorder:
             pass
 
     def display_status(self):
-        now = datetime.now(timezone.utc)
-        elapsed = now - self.start_time
-        hours, remainder = divmod(int(elapsed.total_seconds()), 3600)
+        # The status line only shows whole seconds; redraw it at most once per
+        # display_interval rather than on every ~3Hz snapshot tick
+        mono = time.monotonic()
+        if mono - self._last_render < self.display_interval:
+            return
+        self._last_render = mono
+
+        now_ts = time.time()
+        hours, remainder = divmod(int(now_ts - self.start_ts), 3600)
         minutes, seconds = divmod(remainder, 60)
         
-        curr_time = now.strftime("%H:%M:%S")
-        
-        # Latency calculation
-        curr_ts = time.time()
+        curr_time = time.strftime("%H:%M:%S", time.gmtime(now_ts))
         
         # 15m market info
         up_str = f"U:{self.up_prices['bid']:.3f}/{self.up_prices['ask']:.3f}" if self.up_prices else "U:---"
@@ -446,11 +518,17 @@ class DataRecorder:
     async def connection_health_monitor(self):
         """Monitor connection health and alert on issues (like in original script)"""
         await asyncio.sleep(30)
+        last_overflow = 0
         while self.running:
             await asyncio.sleep(60)
             now = time.time()
             issues = []
             
+            overflow = self.db_writer.overflow
+            if overflow > last_overflow:
+                issues.append(f"DB writer queue full, dropped {overflow - last_overflow} records")
+                last_overflow = overflow
+            
             if self.last_update_ts['binance'] > 0:
                 silence = now - self.last_update_ts['binance']
                 if silence > 60:
@@ -462,7 +540,9 @@ class DataRecorder:
                     issues.append(f"RTDS (Oracle) silent for {silence:.0f}s")
             
             if self.last_update_ts['clob'] > 0:
-                silence = now - self.last_update_ts['clob']
+                # Unchanged prices are not re-emitted, so also count raw frames as liveness
+                last_clob = max(self.last_update_ts['clob'], self.clob_client.last_message_time or 0)
+                silence = now - last_clob
                 if silence > 60:
                     issues.append(f"CLOB silent for {silence:.0f}s")
             
@@ -486,10 +566,16 @@ class DataRecorder:
         
         # Start health monitor
         asyncio.create_task(self.connection_health_monitor())
+
+        # Warm up REST connections in the background so the first discovery round
+        # skips DNS + TLS setup without holding up recording
+        asyncio.create_task(warm_up_http_session())
+        asyncio.create_task(asyncio.to_thread(self.polymarket_api.warm_up))
         
         last_discovery_15m = 0
         last_discovery_5m = 0
         last_heartbeat = 0
+        next_tick = time.monotonic()
         
         try:
             while self.running:
@@ -497,15 +583,20 @@ class DataRecorder:
                 
                 now_ts = time.time()
 
+                discovery = []
                 # 15m market discovery every 60s
                 if now_ts - last_discovery_15m > 60:
-                    await self.update_market_discovery()
+                    discovery.append(self.update_market_discovery())
                     last_discovery_15m = now_ts
 
                 # 5m market discovery every 30s (shorter markets need faster discovery)
                 if now_ts - last_discovery_5m > 30:
-                    await self.update_market_discovery_5m()
+                    discovery.append(self.update_market_discovery_5m())
                     last_discovery_5m = now_ts
+
+                # When both are due, run them side by side instead of back to back
+                if discovery:
+                    await asyncio.gather(*discovery, return_exceptions=True)
                 
                 # Heartbeat every 30s
                 if now_ts - last_heartbeat > 30:
@@ -515,15 +606,25 @@ class DataRecorder:
                 await self.record_snapshot()
                 self.display_status()
                 
-                # ~3Hz recording
-                await asyncio.sleep(0.33)
+                # ~3Hz recording: only sleep for what is left of the tick so
+                # slow iterations (discovery, target price) don't stretch it
+                next_tick += self.snapshot_interval
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    # Fell behind - resync instead of firing a burst of snapshots
+                    next_tick = time.monotonic()
+                    await asyncio.sleep(0)
                 
         except (KeyboardInterrupt, asyncio.CancelledError):
             print("\nStopping...")
         finally:
             self.running = False
+            await close_http_session()
             print("\nWaiting for DB writer to finish...")
-            self.db_writer.stop()
+            # Drain off the event loop so the final flush doesn't block it
+            await asyncio.to_thread(self.db_writer.stop)
             print("Shutdown complete.")
 
 if __name__ == "__main__":
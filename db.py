@@ -5,32 +5,34 @@ Replaces JSONL files with a single SQLite database per date directory,
 providing faster reads and smaller storage.
 """
 
-import json
+import copy
+import orjson
 import os
-import sqlite3
 import queue
+import sqlite3
 import sys
 import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 
 # ---------------------------------------------------------------------------
 # Schema – one table per former JSONL file
+#
+# ``timestamp`` is stored as INTEGER microseconds since the Unix epoch.
+# Databases written by older versions hold ISO-8601 TEXT instead: the writer
+# migrates such a table the first time it touches it, and the readers detect
+# the format per table so untouched older days keep working.
 # ---------------------------------------------------------------------------
 
-_SCHEMAS = {
-    "btc_prices": """
-        CREATE TABLE IF NOT EXISTS btc_prices (
+# The 15m and 5m markets share their table layouts
+_SNAPSHOT_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS {table} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            binance_price REAL,
-            oracle_price REAL,
-            lag_ms INTEGER
-        )
-    """,
-    "market_snapshots_15m": """
-        CREATE TABLE IF NOT EXISTS market_snapshots_15m (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             market_slug TEXT,
             oracle_price REAL,
             binance_price REAL,
@@ -44,29 +46,12 @@ _SCHEMAS = {
             target_price REAL,
             lag_ms INTEGER
         )
-    """,
-    "market_snapshots_5m": """
-        CREATE TABLE IF NOT EXISTS market_snapshots_5m (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            market_slug TEXT,
-            oracle_price REAL,
-            binance_price REAL,
-            up_bid REAL,
-            up_ask REAL,
-            up_mid REAL,
-            down_bid REAL,
-            down_ask REAL,
-            down_mid REAL,
-            time_to_expiry INTEGER,
-            target_price REAL,
-            lag_ms INTEGER
-        )
-    """,
-    "orderbook_15m": """
-        CREATE TABLE IF NOT EXISTS orderbook_15m (
+    """
+
+_ORDERBOOK_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS {table} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             market_slug TEXT,
             up_bids TEXT,
             up_asks TEXT,
@@ -77,26 +62,26 @@ _SCHEMAS = {
             down_bid_total REAL,
             down_ask_total REAL
         )
-    """,
-    "orderbook_5m": """
-        CREATE TABLE IF NOT EXISTS orderbook_5m (
+    """
+
+_SCHEMAS = {
+    "btc_prices": """
+        CREATE TABLE IF NOT EXISTS btc_prices (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            market_slug TEXT,
-            up_bids TEXT,
-            up_asks TEXT,
-            down_bids TEXT,
-            down_asks TEXT,
-            up_bid_total REAL,
-            up_ask_total REAL,
-            down_bid_total REAL,
-            down_ask_total REAL
+            timestamp INTEGER NOT NULL,
+            binance_price REAL,
+            oracle_price REAL,
+            lag_ms INTEGER
         )
     """,
+    "market_snapshots_15m": _SNAPSHOT_SCHEMA.format(table="market_snapshots_15m"),
+    "market_snapshots_5m": _SNAPSHOT_SCHEMA.format(table="market_snapshots_5m"),
+    "orderbook_15m": _ORDERBOOK_SCHEMA.format(table="orderbook_15m"),
+    "orderbook_5m": _ORDERBOOK_SCHEMA.format(table="orderbook_5m"),
     "system_events": """
         CREATE TABLE IF NOT EXISTS system_events (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             event_type TEXT,
             message TEXT
         )
@@ -105,13 +90,61 @@ _SCHEMAS = {
 
 # Columns that store JSON arrays (orderbook bid/ask lists)
 _JSON_COLUMNS = {"up_bids", "up_asks", "down_bids", "down_asks"}
+_EMPTY_JSON_ARRAY = "[]"
+
+# Tables carrying a market_slug column
+_SLUG_TABLES = frozenset({
+    "market_snapshots_15m", "market_snapshots_5m",
+    "orderbook_15m", "orderbook_5m",
+})
+
+# When the writer queue is full, these tables drop their oldest pending record
+# to make room; everything else drops the incoming one.
+_DROP_OLDEST_TABLES = frozenset({"btc_prices"})
+
+# Queued writer-thread tasks that are not records
+_CONTROL_TASKS = frozenset({"__switch_dir__", "__analyze__"})
 
 # Valid table names (whitelist)
 _VALID_TABLES = frozenset(_SCHEMAS.keys())
 
+# Tables whose pending records are superseded by a newer one for the same
+# market: only the latest state is worth writing when the writer falls behind.
+_COALESCE_TABLES = _SLUG_TABLES
+
 DB_FILENAME = "data.db"
 
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+
+
+def _ts_to_us(value) -> int:
+    """Convert an ISO-8601 string (naive means UTC) or epoch µs to epoch µs."""
+    if isinstance(value, str):
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return (dt - _EPOCH) // _ONE_US
+    return int(value)
+
+
+def _ts_to_iso(value) -> str:
+    """Convert epoch µs to an ISO-8601 UTC string (strings pass through)."""
+    if isinstance(value, str):
+        return value
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+def _has_int_timestamps(conn: sqlite3.Connection, table_name: str) -> bool:
+    """True if *table_name* stores ``timestamp`` as INTEGER epoch µs rather
+    than legacy ISO TEXT."""
+    for row in conn.execute(f"PRAGMA table_info({table_name})"):
+        if row[1] == "timestamp":
+            return row[2].upper() == "INTEGER"
+    return False
+
+
 def _validate_table(table_name: str) -> str:
     """Validate *table_name* against known schemas to prevent SQL injection."""
     if table_name not in _VALID_TABLES:
@@ -119,100 +152,381 @@ def _validate_table(table_name: str) -> str:
     return table_name
 
 
+# Connection settings for the writer: WAL with relaxed fsyncs, temp data and
+# a 64 MiB page cache in memory, 256 MiB of the file memory-mapped.  Auto
+# checkpoints are off: DBWriter's checkpoint thread does them instead, so the
+# write path never stalls copying the WAL back.
+_WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA wal_autocheckpoint=0",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def _analyze(conn: sqlite3.Connection):
+    """Refresh planner statistics, sampling at most ~1000 rows per index so
+    the cost stays flat as a day's tables grow."""
+    conn.execute("PRAGMA analysis_limit=1000")
+    conn.execute("ANALYZE")
+
+
+@lru_cache(maxsize=64)
+def _insert_sql(table_name: str, cols: tuple) -> str:
+    """INSERT statement for *cols*; cached so the writer reuses one string per
+    shape and sqlite3's statement cache skips re-preparing it."""
+    return f"INSERT INTO {table_name} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+
+
 # ---------------------------------------------------------------------------
 # Writer – background thread (replaces JSONWriter)
 # ---------------------------------------------------------------------------
 
 class DBWriter(threading.Thread):
-    """Background thread for non-blocking SQLite writes."""
+    """Background thread for non-blocking SQLite writes.
+
+    Pending snapshot records are coalesced per ``(table, market_slug)``: if a
+    newer record arrives before the previous one was written, it replaces it
+    in place instead of queueing another INSERT.  Everything else (system
+    events, directory switches) is written strictly in FIFO order.
+
+    Each wake-up drains up to *batch_size* pending records and writes them
+    in a single transaction, committing at most once per *commit_window*
+    seconds (kept below the recorder's ~0.33s snapshot interval so the
+    window never coalesces away a tick).  At most *max_queue* records are held; see
+    :meth:`add` for what happens when the writer cannot keep up.
+
+    A companion thread checkpoints the WAL every *checkpoint_interval*
+    seconds on its own connection, and hourly queues a refresh of the query
+    planner's statistics for the writer to run.
+    """
 
-    def __init__(self):
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500,
+                 put_timeout: float = 0.1, commit_window: float = 0.25,
+                 checkpoint_interval: float = 30.0):
         super().__init__(daemon=True)
-        self.queue: queue.Queue = queue.Queue()
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.commit_window = commit_window
+        self._last_commit = 0.0
+        self.checkpoint_interval = checkpoint_interval
+        self.analyze_interval = 3600.0
+        self._stopped = threading.Event()
+        self._checkpointer = threading.Thread(target=self._checkpoint_loop, daemon=True)
+        self.overflow = 0  # records dropped because the queue was full
         self.running = True
         self._db_path: str | None = None
         self._conn: sqlite3.Connection | None = None
         self._tables_created: set = set()
+        self._text_ts_tables: set = set()
+        self._json_last: dict[tuple, tuple] = {}  # (table, col) -> (obj, text)
+        # slot -> (coalesce_key, table_name, payload); _order keeps FIFO slots
+        self._pending: dict[int, tuple] = {}
+        self._order: deque[int] = deque()
+        self._latest: dict[tuple, int] = {}
+        self._seq = 0
+        self._cv = threading.Condition()
 
     # -- public API (called from main thread) --------------------------------
 
     def set_data_dir(self, data_dir: str):
         """Set / change output directory.  Old connection is closed first."""
         # Signal the writer thread to switch directories
-        self.queue.put(("__switch_dir__", data_dir))
+        self._enqueue(None, "__switch_dir__", data_dir)
 
     def add(self, table_name: str, record: dict):
-        """Enqueue a record for writing (non-blocking)."""
-        self.queue.put((table_name, record))
+        """Enqueue a record for writing.
+
+        Non-blocking unless the queue is full, in which case this waits up
+        to *put_timeout* and then drops a record (counted in ``overflow``).
+        """
+        key = (table_name, record.get("market_slug")) if table_name in _COALESCE_TABLES else None
+        self._enqueue(key, table_name, record)
 
     def stop(self):
-        self.running = False
+        with self._cv:
+            self.running = False
+            self._cv.notify_all()
         self.join(timeout=5)
-        self._close()
+
+    def _enqueue(self, key: tuple | None, name: str, payload):
+        with self._cv:
+            if key is not None:
+                slot = self._latest.get(key)
+                if slot is not None:
+                    # Override the pending record in place
+                    self._pending[slot] = (key, name, payload)
+                    return
+            if name not in _CONTROL_TASKS and len(self._pending) >= self.max_queue:
+                # Back-pressure: give the writer put_timeout to catch up, then
+                # shed load instead of stalling the producer indefinitely
+                self._cv.wait_for(
+                    lambda: len(self._pending) < self.max_queue or not self.running,
+                    timeout=self.put_timeout,
+                )
+                if len(self._pending) >= self.max_queue:
+                    self.overflow += 1
+                    # BTC ticks are the only series where an older pending
+                    # row is worth less than the new one; drop that instead
+                    if name not in _DROP_OLDEST_TABLES or not self._drop_oldest(name):
+                        return
+            # Directory switches and ANALYZE are never dropped; wait for room
+            while len(self._pending) >= self.max_queue and self.running:
+                self._cv.wait()
+            self._seq += 1
+            slot = self._seq
+            self._pending[slot] = (key, name, payload)
+            self._order.append(slot)
+            if key is not None:
+                self._latest[key] = slot
+            elif name == "__switch_dir__":
+                # Records added after a switch must not be folded into ones
+                # still bound for the previous directory
+                self._latest.clear()
+            self._cv.notify_all()
+
+    def _drop_oldest(self, name: str) -> bool:
+        """Discard the oldest pending *name* record (caller holds ``_cv``)."""
+        for slot in self._order:
+            if self._pending[slot][1] == name:
+                self._order.remove(slot)
+                del self._pending[slot]
+                return True
+        return False
 
     # -- internal (runs on writer thread) ------------------------------------
 
+    def _next_batch(self) -> list[tuple] | None:
+        """Block until work is pending, then take up to ``batch_size`` tasks."""
+        with self._cv:
+            # Sleep until add()/set_data_dir() or stop() signals us
+            self._cv.wait_for(lambda: self._order or not self.running)
+            if not self._order:
+                return None
+            # Group commit: let records arriving within commit_window of the
+            # last commit join this transaction, unless a full batch is ready
+            remaining = self.commit_window - (time.monotonic() - self._last_commit)
+            if remaining > 0:
+                self._cv.wait_for(
+                    lambda: len(self._order) >= self.batch_size or not self.running,
+                    timeout=remaining,
+                )
+            batch = []
+            while self._order and len(batch) < self.batch_size:
+                slot = self._order.popleft()
+                key, name, payload = self._pending.pop(slot)
+                if key is not None and self._latest.get(key) == slot:
+                    del self._latest[key]
+                batch.append((name, payload))
+            self._cv.notify_all()
+            return batch
+
     def run(self):
-        while self.running or not self.queue.empty():
+        self._checkpointer.start()
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
             try:
-                task = self.queue.get(timeout=1)
-                name, payload = task
-                if name == "__switch_dir__":
-                    self._do_switch_dir(payload)
-                else:
-                    self._write_record(name, payload)
-                self.queue.task_done()
-            except queue.Empty:
-                continue
+                self._write_batch(batch)
             except Exception as e:
                 sys.stderr.write(f"\n[DB_WRITER_ERROR] {e}\n")
+            self._last_commit = time.monotonic()
+        # Drained: stop the checkpointer, then close on the thread that owns
+        # the connection
+        self._stopped.set()
+        if self._checkpointer.is_alive():
+            self._checkpointer.join(timeout=5)
+        self._close()
+
+    def _checkpoint_loop(self):
+        """Periodically fold the WAL back into the database and truncate it,
+        off the writer thread.  Runs on a connection of its own."""
+        conn: sqlite3.Connection | None = None
+        path: str | None = None
+        last_analyze = time.monotonic()
+        while not self._stopped.wait(self.checkpoint_interval):
+            db_path = self._db_path
+            if db_path is None:
+                continue
+            try:
+                if db_path != path:
+                    # The writer rotated to a new day
+                    if conn is not None:
+                        conn.close()
+                    conn = sqlite3.connect(db_path, isolation_level=None)
+                    # Never wait on a lock: a waiting checkpoint would hold
+                    # up the writer's next BEGIN IMMEDIATE behind readers
+                    conn.execute("PRAGMA busy_timeout=0")
+                    path = db_path
+                # PASSIVE copies what no reader still needs and never blocks
+                # the writer; only once every frame is back in the database
+                # is the WAL worth truncating
+                busy, log, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                if log > 0 and done == log:
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+                elif done < log:
+                    sys.stderr.write(
+                        f"\n[DB_WRITER] checkpoint deferred by readers ({done}/{log} WAL pages copied)\n"
+                    )
+                if time.monotonic() - last_analyze >= self.analyze_interval:
+                    # ANALYZE writes, so it runs on the writer's connection
+                    self._enqueue(None, "__analyze__", None)
+                    last_analyze = time.monotonic()
+            except sqlite3.Error as e:
+                sys.stderr.write(f"\n[DB_WRITER_ERROR] checkpoint: {e}\n")
+        if conn is not None:
+            conn.close()
 
     def _do_switch_dir(self, data_dir: str):
         self._close()
         Path(data_dir).mkdir(parents=True, exist_ok=True)
         self._db_path = os.path.join(data_dir, DB_FILENAME)
-        self._conn = sqlite3.connect(self._db_path)
+        # Autocommit mode: the writer brackets every batch itself
+        self._conn = sqlite3.connect(self._db_path, cached_statements=256, isolation_level=None)
         # Optimise for write-heavy workload
-        self._conn.execute("PRAGMA journal_mode=WAL")
-        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for pragma in _WRITER_PRAGMAS:
+            self._conn.execute(pragma)
         self._tables_created.clear()
+        self._text_ts_tables.clear()
 
     def _ensure_table(self, table_name: str):
         if table_name not in self._tables_created:
             _validate_table(table_name)
             self._conn.execute(_SCHEMAS[table_name])
             self._conn.commit()
+            if not _has_int_timestamps(self._conn, table_name):
+                # Created by an older version with ISO TEXT timestamps
+                try:
+                    self._migrate_timestamps(table_name)
+                except sqlite3.Error as e:
+                    self._conn.rollback()
+                    sys.stderr.write(
+                        f"\n[DB_WRITER_ERROR] {table_name}: timestamp migration failed ({e}), "
+                        f"keeping TEXT timestamps\n"
+                    )
+                    self._text_ts_tables.add(table_name)
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{table_name}_timestamp ON {table_name}(timestamp)"
+            )
+            if table_name in _SLUG_TABLES:
+                # Serves the web UI's per-market filter and slug dropdown
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table_name}_slug "
+                    f"ON {table_name}(market_slug, timestamp)"
+                )
+            self._conn.commit()
             self._tables_created.add(table_name)
 
-    def _write_record(self, table_name: str, record: dict):
-        if self._conn is None:
-            return
-        self._ensure_table(table_name)
-
-        # Serialise JSON-array columns
-        row = {}
-        for k, v in record.items():
-            if k in _JSON_COLUMNS and isinstance(v, (list, dict)):
-                row[k] = json.dumps(v, ensure_ascii=False)
-            else:
-                row[k] = v
-
-        cols = ", ".join(row.keys())
-        placeholders = ", ".join(["?"] * len(row))
+    def _migrate_timestamps(self, table_name: str):
+        """Rebuild a legacy *table_name* with INTEGER epoch-µs timestamps,
+        converting existing rows (ids are kept)."""
+        legacy = f"{table_name}__legacy"
+        cols = [r[1] for r in self._conn.execute(f"PRAGMA table_info({table_name})")]
+        select = ", ".join("_ts_to_us(timestamp)" if c == "timestamp" else c for c in cols)
+        self._conn.create_function("_ts_to_us", 1, _ts_to_us, deterministic=True)
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute(f"ALTER TABLE {table_name} RENAME TO {legacy}")
+        self._conn.execute(_SCHEMAS[table_name])
         self._conn.execute(
-            f"INSERT INTO {table_name} ({cols}) VALUES ({placeholders})",
-            list(row.values()),
+            f"INSERT INTO {table_name} ({', '.join(cols)}) SELECT {select} FROM {legacy}"
         )
+        self._conn.execute(f"DROP TABLE {legacy}")
         self._conn.commit()
 
+    def _write_batch(self, batch: list[tuple]):
+        """Write *batch* with one ``executemany`` per (table, columns) group
+        and a single commit.  Directory switches flush what came before."""
+        groups: dict[tuple, list[list]] = {}
+        for name, payload in batch:
+            if name == "__switch_dir__":
+                self._flush(groups)
+                groups = {}
+                self._do_switch_dir(payload)
+                continue
+            if name == "__analyze__":
+                self._flush(groups)
+                groups = {}
+                if self._conn is not None:
+                    try:
+                        _analyze(self._conn)
+                    except sqlite3.Error as e:
+                        sys.stderr.write(f"\n[DB_WRITER_ERROR] analyze: {e}\n")
+                continue
+            if self._conn is None:
+                continue
+            self._ensure_table(name)
+            text_ts = name in self._text_ts_tables
+
+            # Serialise JSON-array columns and normalise the timestamp
+            values = []
+            for k, v in payload.items():
+                if k in _JSON_COLUMNS and isinstance(v, (list, dict)):
+                    v = self._json_text(name, k, v)
+                elif k == "timestamp":
+                    v = _ts_to_iso(v) if text_ts else _ts_to_us(v)
+                values.append(v)
+            groups.setdefault((name, tuple(payload.keys())), []).append(values)
+        self._flush(groups)
+
+    def _json_text(self, table_name: str, col: str, value) -> str:
+        """Serialise a JSON column, reusing the previous text when the record
+        carries the very same object (an unchanged order book re-recorded)."""
+        if not value:
+            # Empty side of the book – common, and needs no encoder call
+            return _EMPTY_JSON_ARRAY if isinstance(value, list) else "{}"
+        last = self._json_last.get((table_name, col))
+        if last is not None and last[0] is value:
+            return last[1]
+        # orjson writes UTF-8 unescaped, like json.dumps(ensure_ascii=False)
+        text = orjson.dumps(value).decode()
+        # Holding the object keeps its id from being reused while cached
+        self._json_last[(table_name, col)] = (value, text)
+        return text
+
+    def _flush(self, groups: dict[tuple, list[list]]):
+        if not groups or self._conn is None:
+            return
+        try:
+            # Take the write lock up front rather than upgrading mid-batch
+            self._conn.execute("BEGIN IMMEDIATE")
+            for (table_name, cols), rows in groups.items():
+                self._conn.executemany(_insert_sql(table_name, cols), rows)
+            self._conn.commit()
+        except sqlite3.Error as e:
+            # Don't lose the whole batch to one bad row: retry row by row
+            self._conn.rollback()
+            sys.stderr.write(f"\n[DB_WRITER_ERROR] batch failed ({e}), retrying per row\n")
+            self._conn.execute("BEGIN IMMEDIATE")
+            for (table_name, cols), rows in groups.items():
+                sql = _insert_sql(table_name, cols)
+                for row in rows:
+                    try:
+                        self._conn.execute(sql, row)
+                    except sqlite3.Error as row_err:
+                        sys.stderr.write(f"\n[DB_WRITER_ERROR] {table_name}: {row_err}\n")
+            self._conn.commit()
+
     def _close(self):
         if self._conn is not None:
+            try:
+                # Refresh planner stats and fold the WAL back into the main
+                # file before letting go of the day's database
+                _analyze(self._conn)
+                self._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            except sqlite3.Error as e:
+                sys.stderr.write(f"\n[DB_WRITER_ERROR] close: {e}\n")
             try:
                 self._conn.close()
-            except Exception:
-                pass
+            except sqlite3.Error as e:
+                sys.stderr.write(f"\n[DB_WRITER_ERROR] close: {e}\n")
             self._conn = None
         self._tables_created.clear()
+        self._text_ts_tables.clear()
 
 
 # ---------------------------------------------------------------------------
@@ -223,6 +537,76 @@ def _db_path_for_date(snapshots_dir: str, date: str) -> str:
     return os.path.join(snapshots_dir, date, DB_FILENAME)
 
 
+# Read connections are pooled per database and shared across threads: the
+# web UI's server runs every request on a fresh thread, so a per-thread cache
+# would never be reused.  Idle connections keep SQLite's page cache warm
+# between API calls.
+_READ_POOL_DBS = 8
+_READ_POOL_IDLE = 4
+
+# Ids per ``IN (...)`` lookup when fetching a down-sampled result
+_ID_CHUNK = 500
+
+# get_summary_stats results: db_path -> (file signature, summary)
+_SUMMARY_CACHE_SIZE = 32
+_summary_cache: OrderedDict[str, tuple] = OrderedDict()
+_summary_lock = threading.Lock()
+
+# Scans read through a 256 MiB memory map instead of copying pages into the
+# heap; busy_timeout rides out the writer's checkpoints instead of failing.
+# query_only guarantees a reader never takes the write lock from DBWriter.
+_READER_PRAGMAS = (
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA query_only=ON",
+)
+_read_pools: OrderedDict[str, queue.LifoQueue] = OrderedDict()
+_read_pools_lock = threading.Lock()
+
+
+def _close_idle(pool: queue.LifoQueue):
+    while True:
+        try:
+            pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+
+@contextmanager
+def _read_conn(db_path: str):
+    """Borrow a pooled read connection for *db_path*, returned on exit."""
+    with _read_pools_lock:
+        pool = _read_pools.get(db_path)
+        if pool is None:
+            pool = _read_pools[db_path] = queue.LifoQueue(_READ_POOL_IDLE)
+            if len(_read_pools) > _READ_POOL_DBS:
+                # Forget the database that was used least recently
+                _close_idle(_read_pools.popitem(last=False)[1])
+        else:
+            _read_pools.move_to_end(db_path)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in _READER_PRAGMAS:
+            conn.execute(pragma)
+    try:
+        yield conn
+    finally:
+        with _read_pools_lock:
+            keep = _read_pools.get(db_path) is pool
+        if keep:
+            try:
+                pool.put_nowait(conn)
+                conn = None
+            except queue.Full:
+                pass
+        if conn is not None:
+            conn.close()
+
+
 def read_db(
     snapshots_dir: str,
     date: str,
@@ -249,88 +633,139 @@ def read_db(
     if not os.path.exists(db_path):
         return []
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    try:
+    with _read_conn(db_path) as conn:
+        int_ts = _has_int_timestamps(conn, table_name)
+        to_param = _ts_to_us if int_ts else str
+
         # Build query with optional WHERE clauses
         conditions: list[str] = []
-        params: list[str] = []
-
-        if start_time:
-            conditions.append("timestamp >= ?")
-            params.append(start_time)
-        if end_time:
-            conditions.append("timestamp <= ?")
-            params.append(end_time)
+        params: list = []
+
+        try:
+            if start_time:
+                conditions.append("timestamp >= ?")
+                params.append(to_param(start_time))
+            if end_time:
+                conditions.append("timestamp <= ?")
+                params.append(to_param(end_time))
+        except ValueError:
+            # Malformed time filter (straight from the query string)
+            return []
         if market_slug:
             conditions.append("market_slug = ?")
             params.append(market_slug)
 
         where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
-        query = f"SELECT * FROM {table_name}{where} ORDER BY id"
 
         try:
-            rows = conn.execute(query, params).fetchall()
+            if limit:
+                # Pick the sample from the ids alone, so the wide rows (orderbook
+                # JSON) are only read from disk for the rows actually returned
+                ids = [r[0] for r in conn.execute(
+                    f"SELECT id FROM {table_name}{where} ORDER BY id", params
+                )]
+                if len(ids) > limit:
+                    step = (len(ids) - 1) / (limit - 1) if limit > 1 else 1
+                    sampled = [ids[int(i * step)] for i in range(limit - 1)]
+                    sampled.append(ids[-1])
+                    ids = sampled
+                rows = []
+                for i in range(0, len(ids), _ID_CHUNK):
+                    chunk = ids[i:i + _ID_CHUNK]
+                    rows.extend(conn.execute(
+                        f"SELECT * FROM {table_name} WHERE id IN ({', '.join('?' * len(chunk))}) ORDER BY id",
+                        chunk,
+                    ))
+            else:
+                rows = conn.execute(f"SELECT * FROM {table_name}{where} ORDER BY id", params).fetchall()
         except sqlite3.OperationalError:
             # Table doesn't exist
             return []
 
-        records = []
-        for row in rows:
-            d = dict(row)
-            d.pop("id", None)
-            # Deserialise JSON-array columns
-            for col in _JSON_COLUMNS:
-                if col in d and isinstance(d[col], str):
-                    try:
-                        d[col] = json.loads(d[col])
-                    except (json.JSONDecodeError, TypeError):
-                        pass
-            records.append(d)
-    finally:
-        conn.close()
-
-    if limit and len(records) > limit:
-        step = (len(records) - 1) / (limit - 1) if limit > 1 else 1
-        sampled = [records[int(i * step)] for i in range(limit - 1)]
-        sampled.append(records[-1])
-        records = sampled
+    records = []
+    for row in rows:
+        d = dict(row)
+        d.pop("id", None)
+        if int_ts:
+            d["timestamp"] = _ts_to_iso(d["timestamp"])
+        # Deserialise JSON-array columns
+        for col in _JSON_COLUMNS:
+            if col in d and isinstance(d[col], str):
+                if d[col] == _EMPTY_JSON_ARRAY:
+                    d[col] = []
+                    continue
+                try:
+                    d[col] = orjson.loads(d[col])
+                except orjson.JSONDecodeError:
+                    pass
+        records.append(d)
 
     return records
 
 
+def _db_signature(db_path: str) -> tuple:
+    """Cheap change marker for a database: its own and its WAL's stat."""
+    st = os.stat(db_path)
+    try:
+        wal = os.stat(db_path + "-wal")
+        wal_sig = (wal.st_mtime_ns, wal.st_size)
+    except FileNotFoundError:
+        wal_sig = None
+    return st.st_mtime_ns, st.st_size, wal_sig
+
+
 def get_summary_stats(snapshots_dir: str, date: str) -> dict:
-    """Return summary statistics for a date, computed efficiently with SQL."""
+    """Return summary statistics for a date, computed efficiently with SQL.
+
+    Results are cached per database until its file (or WAL) changes, so
+    finished days are only aggregated once.
+    """
     db_path = _db_path_for_date(snapshots_dir, date)
     if not os.path.exists(db_path):
         return {}
 
+    sig = _db_signature(db_path)
+    with _summary_lock:
+        cached = _summary_cache.get(db_path)
+        if cached is not None and cached[0] == sig:
+            _summary_cache.move_to_end(db_path)
+            return copy.deepcopy(cached[1])
+
+    summary = _compute_summary_stats(db_path, date)
+    with _summary_lock:
+        _summary_cache[db_path] = (sig, summary)
+        _summary_cache.move_to_end(db_path)
+        if len(_summary_cache) > _SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+    return copy.deepcopy(summary)
+
+
+def _compute_summary_stats(db_path: str, date: str) -> dict:
     summary: dict = {"date": date}
-    conn = sqlite3.connect(db_path)
-    try:
+    with _read_conn(db_path) as conn:
         # BTC price stats
         try:
+            # First / last prices ride along as rowid-ordered scalar subqueries,
+            # so the whole block is one statement
             row = conn.execute("""
                 SELECT COUNT(*) as cnt,
                        MIN(binance_price) as min_p,
                        MAX(binance_price) as max_p,
-                       AVG(lag_ms) as avg_lag
+                       AVG(lag_ms) as avg_lag,
+                       (SELECT binance_price FROM btc_prices
+                        WHERE binance_price IS NOT NULL ORDER BY id ASC LIMIT 1) as first_p,
+                       (SELECT binance_price FROM btc_prices
+                        WHERE binance_price IS NOT NULL ORDER BY id DESC LIMIT 1) as last_p
                 FROM btc_prices
                 WHERE binance_price IS NOT NULL
             """).fetchone()
             if row and row[0]:
-                first = conn.execute(
-                    "SELECT binance_price FROM btc_prices WHERE binance_price IS NOT NULL ORDER BY id ASC LIMIT 1"
-                ).fetchone()
-                last = conn.execute(
-                    "SELECT binance_price FROM btc_prices WHERE binance_price IS NOT NULL ORDER BY id DESC LIMIT 1"
-                ).fetchone()
                 summary["btc"] = {
                     "count": row[0],
                     "min": row[1],
                     "max": row[2],
-                    "first": first[0] if first else None,
-                    "last": last[0] if last else None,
+                    "first": row[4],
+                    "last": row[5],
                     "avg_lag_ms": round(row[3]) if row[3] is not None else None,
                 }
         except sqlite3.OperationalError:
@@ -340,8 +775,10 @@ def get_summary_stats(snapshots_dir: str, date: str) -> dict:
         for mt in ("15m", "5m"):
             table = _validate_table(f"market_snapshots_{mt}")
             try:
-                cnt = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-                slugs = conn.execute(f"SELECT COUNT(DISTINCT market_slug) FROM {table}").fetchone()[0]
+                # Both counts in one pass over the table
+                cnt, slugs = conn.execute(
+                    f"SELECT COUNT(*), COUNT(DISTINCT market_slug) FROM {table}"
+                ).fetchone()
                 if cnt:
                     summary[f"markets_{mt}"] = {
                         "snapshot_count": cnt,
@@ -357,8 +794,6 @@ def get_summary_stats(snapshots_dir: str, date: str) -> dict:
                 summary["events"] = cnt
         except sqlite3.OperationalError:
             pass
-    finally:
-        conn.close()
 
     return summary
 
@@ -380,12 +815,11 @@ def list_dates(snapshots_dir: str) -> list[dict]:
         # Check for SQLite database
         if os.path.exists(db_path):
             try:
-                conn = sqlite3.connect(db_path)
-                rows = conn.execute(
-                    "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
-                ).fetchall()
+                with _read_conn(db_path) as conn:
+                    rows = conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name"
+                    ).fetchall()
                 tables = [r[0] for r in rows if not r[0].startswith("sqlite_")]
-                conn.close()
             except sqlite3.Error:
                 pass
 
@@ -408,24 +842,23 @@ def get_time_range(snapshots_dir: str, date: str) -> dict:
     if not os.path.exists(db_path):
         return {}
 
-    conn = sqlite3.connect(db_path)
-    min_ts = None
-    max_ts = None
-    try:
+    with _read_conn(db_path) as conn:
+        min_us = max_us = None
+        min_ts = max_ts = None
         for table in ("btc_prices", "market_snapshots_15m", "market_snapshots_5m"):
             try:
                 row = conn.execute(
                     f"SELECT MIN(timestamp), MAX(timestamp) FROM {table}"
                 ).fetchone()
                 if row and row[0]:
-                    if min_ts is None or row[0] < min_ts:
-                        min_ts = row[0]
-                    if max_ts is None or row[1] > max_ts:
-                        max_ts = row[1]
+                    # Compare in µs so INTEGER and legacy TEXT tables mix
+                    lo, hi = _ts_to_us(row[0]), _ts_to_us(row[1])
+                    if min_us is None or lo < min_us:
+                        min_us, min_ts = lo, _ts_to_iso(row[0])
+                    if max_us is None or hi > max_us:
+                        max_us, max_ts = hi, _ts_to_iso(row[1])
             except sqlite3.OperationalError:
                 continue
-    finally:
-        conn.close()
 
     if min_ts and max_ts:
         return {"min": min_ts, "max": max_ts}
@@ -440,8 +873,7 @@ def get_market_slugs(snapshots_dir: str, date: str, market_type: str = "15m") ->
     if not os.path.exists(db_path):
         return []
 
-    conn = sqlite3.connect(db_path)
-    try:
+    with _read_conn(db_path) as conn:
         try:
             rows = conn.execute(
                 f"SELECT DISTINCT market_slug FROM {table} ORDER BY market_slug"
@@ -449,5 +881,3 @@ def get_market_slugs(snapshots_dir: str, date: str, market_type: str = "15m") ->
             return [r[0] for r in rows if r[0]]
         except sqlite3.OperationalError:
             return []
-    finally:
-        conn.close()
@@ -5,10 +5,11 @@ import json
 import os
 import sqlite3
 import tempfile
+import threading
 import time
 import unittest
 
-from db import DBWriter, DB_FILENAME, read_db, get_summary_stats, list_dates, get_time_range, get_market_slugs
+from db import DBWriter, DB_FILENAME, read_db, get_summary_stats, list_dates, get_time_range, get_market_slugs, _read_conn
 
 
 class TestDBWriter(unittest.TestCase):
@@ -154,6 +155,196 @@ class TestDBWriter(unittest.TestCase):
         self.assertEqual(len(rows_d2), 1)
         self.assertAlmostEqual(rows_d2[0]["binance_price"], 42100.0)
 
+    def test_pending_snapshots_coalesce(self):
+        """A newer pending snapshot for the same market replaces the older one."""
+        w = DBWriter()
+        w.set_data_dir(self.data_dir)
+        for i in range(5):
+            w.add("market_snapshots_15m", {
+                "timestamp": f"2025-01-15T10:00:0{i}+00:00",
+                "market_slug": "btc-updown-15m-a",
+                "up_bid": 0.50 + i / 100,
+            })
+        w.add("market_snapshots_15m", {
+            "timestamp": "2025-01-15T10:00:05+00:00",
+            "market_slug": "btc-updown-15m-b",
+            "up_bid": 0.40,
+        })
+        w.start()
+        self._stop(w)
+
+        rows = read_db(self.tmpdir, "2025-01-15", "market_snapshots_15m")
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["market_slug"], "btc-updown-15m-a")
+        self.assertAlmostEqual(rows[0]["up_bid"], 0.54)
+        self.assertEqual(rows[1]["market_slug"], "btc-updown-15m-b")
+
+    def test_bad_record_does_not_drop_batch(self):
+        """A record that fails to insert must not take the rest of its batch with it."""
+        w = DBWriter()
+        w.set_data_dir(self.data_dir)
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:00+00:00", "binance_price": 1.0})
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:01+00:00", "no_such_column": 1})
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:02+00:00", "binance_price": 2.0})
+        w.start()
+        self._stop(w)
+
+        rows = read_db(self.tmpdir, "2025-01-15", "btc_prices")
+        self.assertEqual([r["binance_price"] for r in rows], [1.0, 2.0])
+
+    def test_full_queue_drops_and_counts(self):
+        """A full queue sheds the oldest BTC tick, or the incoming record for
+        other tables, and counts each drop."""
+        w = DBWriter(max_queue=3, put_timeout=0.01)
+        w.set_data_dir(self.data_dir)
+        for i in range(4):
+            w.add("btc_prices", {"timestamp": f"2025-01-15T10:00:0{i}+00:00", "binance_price": float(i)})
+        w.add("system_events", {"timestamp": "2025-01-15T10:00:05+00:00", "event_type": "x", "message": "y"})
+        self.assertEqual(w.overflow, 3)
+        w.start()
+        self._stop(w)
+
+        rows = read_db(self.tmpdir, "2025-01-15", "btc_prices")
+        self.assertEqual([r["binance_price"] for r in rows], [2.0, 3.0])
+        self.assertEqual(read_db(self.tmpdir, "2025-01-15", "system_events"), [])
+
+    def test_checkpoint_thread_truncates_wal(self):
+        w = DBWriter(checkpoint_interval=0.05)
+        w.start()
+        w.set_data_dir(self.data_dir)
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:00+00:00", "binance_price": 1.0})
+
+        wal = os.path.join(self.data_dir, DB_FILENAME + "-wal")
+        deadline = time.time() + 3
+        while time.time() < deadline:
+            if os.path.exists(wal) and os.path.getsize(wal) == 0 and read_db(self.tmpdir, "2025-01-15", "btc_prices"):
+                break
+            time.sleep(0.02)
+        self.assertEqual(os.path.getsize(wal), 0)
+        self._stop(w)
+
+    def test_periodic_analyze_runs_on_writer(self):
+        w = DBWriter(checkpoint_interval=0.02)
+        w.analyze_interval = 0.0
+        w.start()
+        w.set_data_dir(self.data_dir)
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:00+00:00", "binance_price": 1.0})
+
+        db_path = os.path.join(self.data_dir, DB_FILENAME)
+        found = False
+        deadline = time.time() + 3
+        while not found and time.time() < deadline:
+            time.sleep(0.02)
+            if os.path.exists(db_path):
+                conn = sqlite3.connect(db_path)
+                found = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0] == 1
+                conn.close()
+        self.assertTrue(found)
+        self.assertEqual(w.overflow, 0)
+        self._stop(w)
+
+    def test_checkpoint_does_not_block_writer_behind_reader(self):
+        w = DBWriter(checkpoint_interval=0.02)
+        w.start()
+        w.set_data_dir(self.data_dir)
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:00+00:00", "binance_price": 1.0})
+        db_path = os.path.join(self.data_dir, DB_FILENAME)
+        deadline = time.time() + 3
+        while not read_db(self.tmpdir, "2025-01-15", "btc_prices") and time.time() < deadline:
+            time.sleep(0.02)
+
+        # A reader parked mid-transaction pins its snapshot of the WAL
+        reader = sqlite3.connect(db_path, isolation_level=None)
+        reader.execute("BEGIN")
+        reader.execute("SELECT COUNT(*) FROM btc_prices").fetchone()
+        writer = sqlite3.connect(db_path, isolation_level=None, timeout=5)
+        try:
+            slowest = 0.0
+            for i in range(25):
+                t0 = time.monotonic()
+                writer.execute("BEGIN IMMEDIATE")
+                writer.execute("INSERT INTO btc_prices (timestamp, binance_price) VALUES (?, ?)", (i, 2.0))
+                writer.execute("COMMIT")
+                slowest = max(slowest, time.monotonic() - t0)
+                time.sleep(0.01)
+        finally:
+            writer.close()
+            reader.execute("COMMIT")
+            reader.close()
+            self._stop(w)
+        self.assertLess(slowest, 0.2)
+
+    def test_stop_closes_database_on_writer_thread(self):
+        w = self._make_writer()
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:00+00:00", "binance_price": 1.0})
+        self._stop(w)
+        self.assertIsNone(w._conn)
+
+        # Shutdown ANALYZE ran and the WAL was folded back and removed
+        db_path = os.path.join(self.data_dir, DB_FILENAME)
+        self.assertFalse(os.path.exists(db_path + "-wal"))
+        conn = sqlite3.connect(db_path)
+        stats = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0]
+        conn.close()
+        self.assertEqual(stats, 1)
+
+    def test_timestamps_stored_as_epoch_us(self):
+        """New tables store INTEGER µs; readers convert back to ISO strings."""
+        w = self._make_writer()
+        w.add("btc_prices", {"timestamp": 1736935200_000000, "binance_price": 1.0})
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:01.500000+00:00", "binance_price": 2.0})
+        self._stop(w)
+
+        conn = sqlite3.connect(os.path.join(self.data_dir, DB_FILENAME))
+        raw = [r[0] for r in conn.execute("SELECT timestamp FROM btc_prices ORDER BY id")]
+        conn.close()
+        self.assertEqual(raw, [1736935200_000000, 1736935201_500000])
+
+        rows = read_db(self.tmpdir, "2025-01-15", "btc_prices")
+        self.assertEqual(rows[0]["timestamp"], "2025-01-15T10:00:00+00:00")
+        self.assertEqual(rows[1]["timestamp"], "2025-01-15T10:00:01.500000+00:00")
+
+        rows = read_db(self.tmpdir, "2025-01-15", "btc_prices",
+                       start_time="2025-01-15T10:00:01")
+        self.assertEqual([r["binance_price"] for r in rows], [2.0])
+
+    def test_malformed_time_filter_returns_empty(self):
+        w = self._make_writer()
+        w.add("btc_prices", {"timestamp": "2025-01-15T10:00:00+00:00", "binance_price": 1.0})
+        self._stop(w)
+
+        self.assertEqual(read_db(self.tmpdir, "2025-01-15", "btc_prices", start_time="not-a-time"), [])
+        self.assertEqual(read_db(self.tmpdir, "2025-01-15", "btc_prices", end_time="2025-13-45T99:00"), [])
+
+    def test_legacy_text_timestamp_table_migrated(self):
+        """A table created with TEXT timestamps is converted to epoch µs
+        before the writer appends to it."""
+        os.makedirs(self.data_dir)
+        db_path = os.path.join(self.data_dir, DB_FILENAME)
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE btc_prices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL, binance_price REAL, oracle_price REAL, lag_ms INTEGER
+            )
+        """)
+        conn.execute("INSERT INTO btc_prices (timestamp, binance_price) VALUES ('2025-01-15T09:59:59.250000+00:00', 0.5)")
+        conn.commit()
+        conn.close()
+
+        w = self._make_writer()
+        w.add("btc_prices", {"timestamp": 1736935200_000000, "binance_price": 1.0})
+        self._stop(w)
+
+        conn = sqlite3.connect(db_path)
+        raw = conn.execute("SELECT id, timestamp FROM btc_prices ORDER BY id").fetchall()
+        conn.close()
+        self.assertEqual(raw, [(1, 1736935199_250000), (2, 1736935200_000000)])
+
+        rows = read_db(self.tmpdir, "2025-01-15", "btc_prices")
+        self.assertEqual([r["timestamp"] for r in rows],
+                         ["2025-01-15T09:59:59.250000+00:00", "2025-01-15T10:00:00+00:00"])
+
 
 class TestReadDB(unittest.TestCase):
     """Test read_db helper."""
@@ -204,6 +395,22 @@ class TestReadDB(unittest.TestCase):
         rows = read_db(self.tmpdir, "1999-01-01", "btc_prices")
         self.assertEqual(rows, [])
 
+    def test_read_connection_reused_across_threads(self):
+        # The web UI serves every request on a new thread
+        with _read_conn(self.db_path) as conn:
+            first = id(conn)
+        seen = []
+
+        def worker():
+            with _read_conn(self.db_path) as c:
+                seen.append(id(c))
+                seen.append(len(c.execute("SELECT * FROM btc_prices").fetchall()))
+
+        t = threading.Thread(target=worker)
+        t.start()
+        t.join()
+        self.assertEqual(seen, [first, 100])
+
 
 class TestGetSummaryStats(unittest.TestCase):
     """Test get_summary_stats helper."""
@@ -273,6 +480,19 @@ class TestGetSummaryStats(unittest.TestCase):
 
         self.assertEqual(s["events"], 1)
 
+    def test_summary_cached_until_db_changes(self):
+        first = get_summary_stats(self.tmpdir, self.date)
+        first["btc"]["count"] = -1  # callers get their own copy
+        self.assertEqual(get_summary_stats(self.tmpdir, self.date)["btc"]["count"], 3)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO btc_prices VALUES (NULL, '2025-03-01T10:00:03', 51000.0, 50999.0, 50)")
+        conn.commit()
+        conn.close()
+        s = get_summary_stats(self.tmpdir, self.date)
+        self.assertEqual(s["btc"]["count"], 4)
+        self.assertAlmostEqual(s["btc"]["last"], 51000.0)
+
     def test_summary_nonexistent(self):
         s = get_summary_stats(self.tmpdir, "1999-01-01")
         self.assertEqual(s, {})